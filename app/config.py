@@ -1,13 +1,26 @@
 from pathlib import Path
+from functools import cache
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import asyncio
+import hashlib
+import logging
+import threading
 import sys
-from app.config_model import MainConfig
+from app.config_model import MainConfig, hash_cost_units
+from app.models import EventSources
 
 PROJECT_ROOT = Path(__file__).parents[1]
+CONFIG_PATH = PROJECT_ROOT / "configs/config.json"
 
+# settings only read on startup, changing them requires a restart
+RESTART_REQUIRED = {"database_name", "database_path", "sql_instrumentation", "async_database", "staging_store", "config_reload"}
 
-def parse_config() -> MainConfig:
-    
-    config_path = PROJECT_ROOT / "configs/config.json"
+logger = logging.getLogger(__name__)
+
+
+def read_config(config_path:Path = CONFIG_PATH) -> MainConfig:
+    """Reads and validates the configuration file"""
 
     with open(config_path, "r") as f:
         config = f.read()
@@ -17,6 +30,206 @@ def parse_config() -> MainConfig:
     return config
 
 
+def parse_config() -> MainConfig:
+    """Returns the current configuration, shared by all modules of the process.
+    Settings not listed in RESTART_REQUIRED may change while the app is running. They should be read on every use
+    instead of keeping the returned instance, since it is replaced when the configuration is reloaded."""
+    return config_service().current.config
+
+
+def current_config() -> "ConfigSnapshot":
+    """Returns the current configuration along with the lookup structures derived from it"""
+    return config_service().current
+
+
+@contextmanager
+def pinned_config() -> Iterator["ConfigSnapshot"]:
+    """Like current_config, but no reload rebuilds tables derived from the configuration or swaps in a new one
+    until the with block is left. Use it around queries on such tables, e.g. the aggregation by cost units."""
+    with config_service().pinned() as config:
+        yield config
+
+
+@cache
+def config_service() -> "ConfigService":
+    """The configuration service of this process, reading the configuration on first call"""
+    return ConfigService(CONFIG_PATH)
+
+
+# ---------------------------------------------------------------------------------------
+# Hot reloading
+#   - the configuration file is polled for changes by ConfigService.watch() while the app is running
+#   - changed files are validated as a whole. Invalid versions are logged and ignored,
+#     the previous configuration stays in place until the file is fixed
+#   - valid versions are swapped in as a new snapshot at once, so a request either sees
+#     the old or the new configuration along with matching lookup structures, never a mix
+#   - callbacks subscribed before the swap prepare state depending on the configuration,
+#     e.g. tables derived from the cost units, and may reject the new version by raising.
+#     Callbacks subscribed after the swap invalidate caches of results computed with the old version
+#   - the callbacks and the swap run while holding a shared lock exclusively. Queries on tables derived
+#     from the configuration hold it shared via pinned_config(), so they either run before the rebuild
+#     with the old snapshot or after the swap with the new one. Pinned blocks must not nest, since
+#     a waiting reload blocks new shared holders
+# ---------------------------------------------------------------------------------------
+
+Callback = Callable[["ConfigSnapshot", "ConfigSnapshot"], None] # called with old and new snapshot
+
+
+class SharedLock:
+    """Lock held shared by any number of threads or exclusively by one.
+    Waiting exclusive holders take precedence, so that a steady stream of shared holders can not starve them."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._n_shared = 0
+        self._n_exclusive_waiting = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._condition:
+            self._condition.wait_for(lambda: not self._exclusive and self._n_exclusive_waiting == 0)
+            self._n_shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._n_shared -= 1
+                if self._n_shared == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._condition:
+            self._n_exclusive_waiting += 1
+            self._condition.wait_for(lambda: not self._exclusive and self._n_shared == 0)
+            self._n_exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+class ConfigSnapshot:
+    """A validated configuration with lookup structures precomputed from it.
+    Snapshots are never modified, a reload creates a new one."""
+
+    def __init__(self, config:MainConfig):
+        self.config = config
+        self.cost_units_hash = hash_cost_units(config.cost_units)
+
+        # fingerprint of all settings the aggregated minutes depend on, used to key results computed from them
+        overlaps = config.event_overlaps.model_dump_json()
+        self.aggregation_hash = hashlib.sha256(f"{self.cost_units_hash}{overlaps}".encode("utf-8")).hexdigest()
+
+        # cost unit names in configured order, as pivoted into columns by the aggregation
+        self.pivot_columns = tuple(config.cost_units.keys())
+
+        # labels of the cost units shown in reports
+        self.labels = {k: v.label for k, v in config.cost_units.items()}
+
+        # cost unit of each mapped category, per event source
+        self.cost_unit_by_category: dict[str, dict[str, str]] = {s.value: dict() for s in EventSources}
+        for cost_unit, mapping in config.cost_units.items():
+            for source, categories in self.cost_unit_by_category.items():
+                for category in getattr(mapping, source):
+                    categories[category] = cost_unit
+
+
+class ConfigService:
+    """Holds the current configuration snapshot and replaces it when the configuration file changes"""
+
+    def __init__(self, config_path:Path):
+        self.config_path = config_path
+        self._lock = threading.Lock() # serializes reloads
+        self._swap_lock = SharedLock() # held exclusively while rebuilding derived state and swapping
+        self._before_swap: list[Callback] = list()
+        self._after_swap: list[Callback] = list()
+        self._file_state = self._stat()
+        self._current = ConfigSnapshot(read_config(config_path))
+
+    @property
+    def current(self) -> ConfigSnapshot:
+        return self._current
+
+    @contextmanager
+    def pinned(self) -> Iterator[ConfigSnapshot]:
+        """Yields the current snapshot, which stays current until the with block is left, see pinned_config"""
+        with self._swap_lock.shared():
+            yield self._current
+
+    def subscribe(self, callback:Callback, before_swap:bool = False) -> None:
+        if before_swap:
+            self._before_swap.append(callback)
+        else:
+            self._after_swap.append(callback)
+
+    def reload(self) -> bool:
+        """Reloads the configuration if the file changed since it was last read.
+        Returns True if a new configuration was swapped in."""
+
+        with self._lock:
+
+            file_state = self._stat()
+            if file_state == self._file_state:
+                return False
+            self._file_state = file_state
+
+            try:
+                new = ConfigSnapshot(read_config(self.config_path))
+            except (OSError, ValueError) as exc: # pydantic's ValidationError is a ValueError
+                logger.error("Ignoring invalid configuration file %s: %s", self.config_path, exc)
+                return False
+
+            old = self._current
+            if new.config == old.config:
+                return False
+
+            with self._swap_lock.exclusive():
+
+                try:
+                    for callback in self._before_swap:
+                        callback(old, new)
+                except Exception:
+                    logger.exception("Applying the changed configuration failed, keeping the previous one")
+                    return False
+
+                self._current = new
+
+                for callback in self._after_swap:
+                    try:
+                        callback(old, new)
+                    except Exception:
+                        logger.exception("Callback after reloading the configuration failed")
+
+        changed = [k for k in MainConfig.model_fields if getattr(old.config, k) != getattr(new.config, k)]
+        print(f"Reloaded configuration from {self.config_path}, changed settings: {changed}")
+        restart_required = RESTART_REQUIRED.intersection(changed)
+        if restart_required:
+            print(f"Changes to {sorted(restart_required)} take effect after restarting the app")
+
+        return True
+
+    async def watch(self, interval_seconds:float) -> None:
+        """Checks the configuration file for changes in given interval until cancelled"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception:
+                logger.exception("Reloading the configuration failed")
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            stat = self.config_path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
 def get_root_path() -> Path:
     """returns the root path of the project and modifies it when run as pyinstaller bundle
         see https://pyinstaller.org/en/stable/runtime-information.html#using-file 
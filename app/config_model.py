@@ -1,5 +1,8 @@
+import json
+import hashlib
 from pydantic import BaseModel, Field, model_validator
 from app.models import EventSources
+from typing import Literal
 from typing_extensions import Self
 
 MANDATORY_COST_UNITS = {"default_cost_unit", "overhead"}
@@ -19,10 +22,57 @@ class CostUnit(BaseModel):
         return self
 
 
+def hash_cost_units(cost_units:dict[str, CostUnit]) -> str:
+    """Fingerprint of the cost unit configuration, used to detect changes"""
+    cost_units = {k: v.model_dump() for k, v in cost_units.items()}
+    return hashlib.sha256(json.dumps(cost_units, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SqlInstrumentation(BaseModel):
+    """Opt-in collection of query metrics, exposed through /api/sql_metrics"""
+    enabled: bool = False
+    slow_query_threshold_ms: float = Field(default=100, ge=0)
+
+
+class AsyncDatabase(BaseModel):
+    """Executors running database calls of request handlers"""
+    read_workers: int = Field(default=4, ge=1)
+    max_pending: int = Field(default=64, ge=1) # queued or running calls, further calls have to wait
+    queue_timeout_seconds: float = Field(default=10, gt=0) # requests fail with 503 when waiting longer
+
+
+class CacheJanitor(BaseModel):
+    """Periodic cleanup of data cached for import previews"""
+    interval_seconds: float = Field(default=60, gt=0)
+    max_age_minutes: int = Field(default=20, ge=0) # older caches are deleted
+    max_rows: int = Field(default=200_000, ge=0) # oldest caches are deleted while all caches together exceed this
+    max_bytes: int = Field(default=100_000_000, ge=0) # same for the estimated size of all cached values
+
+
+class ConfigReload(BaseModel):
+    """Changes of the configuration file are applied while the app is running, see config.ConfigService"""
+    enabled: bool = True
+    interval_seconds: float = Field(default=2, gt=0) # how often the file is checked for changes
+
+
+class EventOverlaps(BaseModel):
+    """How time covered by overlapping events is counted, see interval_engine.
+    "count_all" keeps counting every event in full"""
+    policy: Literal["count_all", "merge", "source_priority"] = "count_all"
+    source_priority: list[EventSources] = [EventSources.KAPOW, EventSources.OUTLOOK] # first source wins
+
+
 class MainConfig(BaseModel):
     database_name: str = Field(pattern=r".*\.sqlite3$")
     database_path: str
     cost_units: dict[str, CostUnit]
+    sql_instrumentation: SqlInstrumentation = Field(default_factory=SqlInstrumentation)
+    async_database: AsyncDatabase = Field(default_factory=AsyncDatabase)
+    cache_janitor: CacheJanitor = Field(default_factory=CacheJanitor)
+    staging_store: Literal["memory", "temp_file"] = "memory" # where imports are cached until confirmed
+    parser_pool: Literal["thread", "process"] = "thread" # "process" parses import files on multiple cores
+    config_reload: ConfigReload = Field(default_factory=ConfigReload)
+    event_overlaps: EventOverlaps = Field(default_factory=EventOverlaps)
 
     @model_validator(mode="after")
     def check_mandatory_cost_units(self) -> Self:
@@ -39,10 +89,16 @@ class MainConfig(BaseModel):
             raise ValueError(f'In "default_cost_unit", the following mandatory categores are missing for "outlook": {missing}')
         return self
     
-    def mapped_categories_of_event_source(self, event_source: EventSources) -> list:
-        all_categories = list()
-        for cost_unit in self.cost_units.values():
-            cost_unit = cost_unit.model_dump()
-            categories = cost_unit.get(event_source)
-            all_categories.extend(categories)
-        return all_categories
+    @model_validator(mode="after")
+    def check_categories_mapped_to_one_cost_unit(self) -> Self:
+        # time spent on events with such a category would be booked to each of its cost units
+        for source in EventSources:
+            cost_units_by_category = dict()
+            for cost_unit, mapping in self.cost_units.items():
+                for category in getattr(mapping, source.value):
+                    cost_units_by_category.setdefault(category, []).append(cost_unit)
+            redundant = {c: u for c, u in cost_units_by_category.items() if len(u) > 1}
+            if len(redundant) > 0:
+                raise ValueError(f'The following categories of "{source.value}" are mapped to multiple cost units: {redundant}')
+        return self
+
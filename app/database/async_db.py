@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable
+
+import app.database.sqlite_operations as sql_ops
+
+# ---------------------------------------------------------------------------------------
+# Async facade over sqlite_operations (and functions composed of them, e.g. in db.py)
+#   - blocking sqlite calls run on dedicated executors instead of fastapi's default threadpool,
+#     so slow reports can not starve other requests of threads
+#   - reads run on several threads, each using its own pooled reader connection,
+#     writes run on a single thread, as sqlite only supports one writer at a time anyway
+#   - the number of pending calls (queued or running) is bounded. When the limit is reached,
+#     callers wait for a free slot (backpressure) and give up after a timeout 
+# ---------------------------------------------------------------------------------------
+
+SETTINGS = sql_ops.CONFIG.async_database
+
+
+class DatabaseOverloadedError(Exception):
+    """Raised when a database call could not be queued within the configured timeout"""
+
+
+_read_executor = ThreadPoolExecutor(max_workers=SETTINGS.read_workers, thread_name_prefix="db-read")
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+# asyncio primitives are bound to an event loop, hence one semaphore per loop
+_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(SETTINGS.max_pending)
+    return _semaphores[loop]
+
+
+async def run(func:Callable, *args, write:bool = False, **kwargs) -> Any:
+    """Runs a blocking database function on the read or write executor"""
+
+    semaphore = _get_semaphore()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=SETTINGS.queue_timeout_seconds)
+    except asyncio.TimeoutError:
+        msg = f"More than {SETTINGS.max_pending} database operations pending for {SETTINGS.queue_timeout_seconds} seconds"
+        raise DatabaseOverloadedError(msg)
+    
+    try:
+        executor = _write_executor if write else _read_executor
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    finally:
+        semaphore.release()
+
+# ---------------------------------------------------------------------------------------
+# READ ONLY OPERATIONS
+# ---------------------------------------------------------------------------------------
+
+async def fetch(sql:str, params:dict | tuple = ()) -> tuple:
+    return await run(sql_ops.fetch, sql, params)
+
+
+async def fetch_all(sql:str, params:dict | tuple = ()) -> list[tuple]:
+    return await run(sql_ops.fetch_all, sql, params)
+
+
+async def fetch_all_as_dicts(sql:str, params:dict) -> list[dict]:
+    return await run(sql_ops.fetch_all_as_dicts, sql, params)
+
+
+async def iter_batches(sql:str, params:dict | tuple = (), batch_size:int = 1000) -> AsyncIterator[list[tuple]]:
+    """Yields the result in batches, each fetched on the read executor.
+    A slot of the pending calls is only taken while a batch is fetched, not for the whole iteration."""
+    batches = sql_ops.iter_batches(sql, params, batch_size)
+    try:
+        while (batch := await run(next, batches, None)) is not None:
+            yield batch
+    finally:
+        try:
+            batches.close()
+        except ValueError:
+            pass # still fetching on the executor when cancelled, closed on garbage collection instead
+
+# ---------------------------------------------------------------------------------------
+# WRITE OPERATIONS
+# ---------------------------------------------------------------------------------------
+
+async def execute(sql:str, params:dict | tuple = ()) -> None:
+    return await run(sql_ops.execute, sql, params, write=True)
+
+
+async def execute_script(sql_script:str) -> None:
+    return await run(sql_ops.execute_script, sql_script, write=True)
@@ -0,0 +1,45 @@
+import asyncio
+import logging
+
+import app.database.db as db
+import app.database.async_db as adb
+from app.config import parse_config
+from app.config_model import CacheJanitor
+
+# ---------------------------------------------------------------------------------------
+# Periodic cleanup of the cache tables holding import previews
+#   - previews that are neither confirmed nor rejected would otherwise stay cached forever
+#   - caches are deleted by age first, then the oldest ones while a row or size budget is exceeded
+#   - started as a background task in the lifespan of the app, see main.py
+#   - deletions are printed like the other status messages of the app,
+#     failed runs are logged with their traceback
+# ---------------------------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+
+def clean(settings:CacheJanitor) -> dict[str, int]:
+    """Runs one cleanup. Returns the number of deleted rows per cache table"""
+
+    deleted_by_age = db.clean_cache_by_age(settings.max_age_minutes)
+    deleted_by_budget = db.clean_cache_by_budget(settings.max_rows, settings.max_bytes)
+
+    if any(deleted_by_age.values()):
+        print(f"Deleted cached rows older than {settings.max_age_minutes} minutes: {deleted_by_age}")
+    if any(deleted_by_budget.values()):
+        print(f"Cache exceeded {settings.max_rows} rows or {settings.max_bytes} bytes, deleted oldest cached rows: {deleted_by_budget}")
+
+    return {table: deleted_by_age[table] + deleted_by_budget[table] for table in deleted_by_age}
+
+
+async def run_periodically() -> None:
+    """Cleans the cache right away and then in the configured interval until cancelled.
+    Failed runs are logged and retried in the next interval.
+    Settings are read on every run, so changes to the configuration apply without restart."""
+    while True:
+        settings = parse_config().cache_janitor
+        try:
+            await adb.run(clean, settings, write=True)
+        except Exception:
+            logger.exception("Cleaning the cache tables failed")
+        await asyncio.sleep(settings.interval_seconds)
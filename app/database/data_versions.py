@@ -0,0 +1,51 @@
+import threading
+from datetime import date, timedelta
+
+# ---------------------------------------------------------------------------------------
+# In-process versions of stored data, used to key cached results and ETags.
+#   - the global version is persisted with the stored data (see db.store_data_many),
+#     restore() picks it up on startup
+#   - each call to bump() sets a new global version 
+#     and assigns it to every date in the given range
+#   - results for a date range stay valid as long as version_of() that range is unchanged,
+#     i.e. imports into other months do not invalidate them
+#   - dates not changed since startup have the version restored on startup, so versions 
+#     never repeat across restarts with different data
+# ---------------------------------------------------------------------------------------
+
+_lock = threading.Lock()
+_global_version = 0
+_base_version = 0
+_date_versions: dict[date, int] = dict()
+
+
+def restore(version:int) -> None:
+    """Sets the persisted version as version of all dates, e.g. on startup"""
+    global _global_version, _base_version
+    with _lock:
+        _global_version = _base_version = version
+        _date_versions.clear()
+
+
+def bump(min_date:date, max_date:date, version:int | None = None) -> int:
+    """Marks all dates in given range as changed, either with given version or by incrementing
+    the global version. Returns the new global version"""
+    global _global_version
+    with _lock:
+        _global_version = _global_version + 1 if version is None else version
+        n_days = (max_date - min_date).days + 1
+        for i in range(n_days):
+            _date_versions[min_date + timedelta(days=i)] = _global_version
+        return _global_version
+
+
+def version_of(from_date:date, to_date:date) -> int:
+    """Returns the latest version of any date in given range"""
+    with _lock:
+        versions = (v for d, v in _date_versions.items() if from_date <= d <= to_date)
+        return max(versions, default=_base_version)
+
+
+def global_version() -> int:
+    """Returns the latest version of all data, incremented on every change"""
+    return _global_version
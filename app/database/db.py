@@ -1,19 +1,33 @@
-import json
 from datetime import date, datetime, timedelta
 from uuid import UUID
+import random
 
 import app.database.sqlite_operations as sql_ops
-from app.models import CoreDataModel, EZeitDay, EZeitDayCache, Event, EventCache
-from app.database.pydantic_to_sqlite import create_table_from_pydantic
+import app.database.data_versions as data_versions
+from app.config_model import CostUnit, hash_cost_units
+from app.models import (
+    CoreDataModel, EZeitDay, EZeitDayCache, Event, EventCache, EventCategory, 
+    CostUnitCategory, DailyCostUnitMinutes, Metadata, EventSources
+)
+from app.database.pydantic_to_sqlite import (
+    create_table_from_pydantic, add_missing_generated_columns, create_indexes_from_pydantic,
+    sql_create_table_from_pydantic, sql_create_indexes_from_pydantic, table_columns, models_to_rows
+)
 
 CORE_DATA_MODELS = [
-    EZeitDay, EZeitDayCache, 
-    Event, EventCache
+    EZeitDay, Event,
+    EventCategory, CostUnitCategory, DailyCostUnitMinutes,
+    Metadata
 ]
 
-CORE_DATA_CACHES = [EZeitDayCache, EventCache]
+CORE_DATA_CACHES = [EZeitDayCache, EventCache] # tables of the staging store
+
+# indexes of earlier versions, replaced by ones extended with the id for keyset pagination
+SUPERSEDED_INDEXES = ["idx_ezeit_days_date", "idx_events_source_start"]
 
 def initiate_db(models:list[CoreDataModel] = CORE_DATA_MODELS) -> None:
+    """Creates missing tables, generated columns and indexes. 
+    Safe to run on existing databases, e.g. to migrate them after indexes were added to a model."""
     
     sql_ops.create_db()
  
@@ -21,23 +35,129 @@ def initiate_db(models:list[CoreDataModel] = CORE_DATA_MODELS) -> None:
         table_name = model.table_name
         primary_key = model.primary_key
         create_table_from_pydantic(table_name, model, primary_key)
+        add_missing_generated_columns(table_name, model)
+        create_indexes_from_pydantic(table_name, model)
+
+    for index_name in SUPERSEDED_INDEXES:
+        sql_ops.execute(f"DROP INDEX IF EXISTS {index_name};")
+
+    _backfill_event_categories()
+    _initiate_staging()
+
+    data_versions.restore(get_data_version())
+
+
+def _initiate_staging(cache_models:list[CoreDataModel] = CORE_DATA_CACHES) -> None:
+    """Creates the cache tables in the staging store.
+    Cache tables left in the main database by earlier versions are dropped."""
+
+    sql_script = ""
+    for model in cache_models:
+        table_name = model.table_name
+        _, _, legacy_table_name = table_name.rpartition(".")
+        sql_ops.execute(f"DROP TABLE IF EXISTS main.{legacy_table_name};")
+        sql_script += sql_create_table_from_pydantic(table_name, model, model.primary_key)
+        sql_script += "".join(sql_create_indexes_from_pydantic(table_name, model))
+
+    sql_ops.set_staging_schema(sql_script)
+
+
+def _backfill_event_categories() -> None:
+    """Populates the event categories table for databases created before it existed"""
+
+    sql = f"SELECT EXISTS (SELECT 1 FROM {EventCategory.table_name})"
+    if sql_ops.fetch(sql)[0] == 1:
+        return
+
+    sql = f"""INSERT INTO {EventCategory.table_name}(event_id, source, category)
+        SELECT e.id, e.source, c.value FROM {Event.table_name} e, json_each(e.categories) c;"""
+    sql_ops.execute(sql)
+
+
+def get_metadata(key:str) -> str | None:
+    sql = f"SELECT value FROM {Metadata.table_name} WHERE key = ?"
+    record = sql_ops.fetch(sql, (key,))
+    return None if record is None else record[0]
+
+
+def get_data_version() -> int:
+    """Returns the number of stores into the database, see store_data_many"""
+    version = get_metadata("data_version")
+    return 0 if version is None else int(version)
+
+
+def _sql_refresh_daily_cost_unit_minutes(date_range:str | None = None) -> tuple[str, str]:
+    """Returns sql statements recomputing the daily minutes per cost unit, 
+    restricted to dates in date_range (e.g. "BETWEEN '2025-01-01' AND '2025-01-31'") or for all dates if no range is given.
+    Minutes are truncated per event before summing them up, as in the original aggregation query."""
+
+    table = DailyCostUnitMinutes.table_name
+    where_daily = "" if date_range is None else f"WHERE date {date_range}"
+    where_events = "" if date_range is None else f"WHERE e.{Event.date_column} {date_range}"
+
+    sql_delete = f"DELETE FROM {table} {where_daily};"
+    sql_insert = f"""INSERT INTO {table}(date, cost_unit, minutes)
+        SELECT 
+            e.{Event.date_column}, m.cost_unit, 
+            SUM((unixepoch(e.end) - unixepoch(e.start)) / 60)
+        FROM {Event.table_name} e
+        JOIN {EventCategory.table_name} c ON c.event_id = e.id
+        JOIN {CostUnitCategory.table_name} m ON m.source = c.source AND m.category = c.category
+        {where_events}
+        GROUP BY e.{Event.date_column}, m.cost_unit;"""
+    
+    return sql_delete, sql_insert
+
+
+def sync_cost_units(cost_units:dict[str, CostUnit]) -> bool:
+    """Rebuilds the mapping of categories to cost units as well as the daily minutes per cost unit
+    if the cost unit configuration changed since the last call. Returns True if tables were rebuilt."""
+
+    config_hash = hash_cost_units(cost_units)
+    if get_metadata("cost_units_hash") == config_hash:
+        return False
+    
+    records = list()
+    for cost_unit, mapping in cost_units.items():
+        mapping = mapping.model_dump()
+        for source in EventSources:
+            records.extend((cost_unit, source.value, category) for category in mapping[source.value])
+
+    # all statements run in one transaction, since the write manager only commits at the end
+    with sql_ops.write_manager() as cur:
+        cur.execute(f"DELETE FROM {CostUnitCategory.table_name};")
+        cur.executemany(f"INSERT INTO {CostUnitCategory.table_name}(cost_unit, source, category) VALUES (?, ?, ?);", records)
+        for statement in _sql_refresh_daily_cost_unit_minutes():
+            cur.execute(statement)
+        cur.execute(f"INSERT OR REPLACE INTO {Metadata.table_name}(key, value) VALUES ('cost_units_hash', ?);", (config_hash,))
+    
+    return True
 
 
-def _insert_parsed_data(table_name:str, data:list[CoreDataModel]) -> None:
+def get_event_intervals(from_date:date, to_date:date) -> list[dict]:
+    """Events in given date range with the cost unit each is mapped to, as input for the interval engine.
+    Events mapped to several cost units are returned once per cost unit, as they are counted in daily_cost_unit_minutes."""
 
-    # dump pydantic models to json so that types like datetime or UUID become strings
-    # round_trip=True preserves nested JSON
-    # see https://github.com/pydantic/pydantic/discussions/7204
-    # and https://docs.pydantic.dev/latest/concepts/serialization/#modelmodel_dump
-    data = (x.model_dump_json(round_trip=True) for x in data)
+    sql = f"""SELECT e.id, e.source, e.start, e.end, e.{Event.date_column} AS date, m.cost_unit
+        FROM {Event.table_name} e
+        JOIN {EventCategory.table_name} c ON c.event_id = e.id
+        JOIN {CostUnitCategory.table_name} m ON m.source = c.source AND m.category = c.category
+        WHERE e.{Event.date_column} BETWEEN :from_date AND :to_date
+        ORDER BY e.{Event.date_column}, e.start;"""
+    params = {"from_date": from_date.isoformat(), "to_date": to_date.isoformat()}
 
-    # load json to get a dict of basic python types again, as needed for 
-    data = (json.loads(x) for x in data) 
+    return sql_ops.fetch_all_as_dicts(sql, params)
 
-    # convert to a list of tuples for insert_many operation
-    data = [tuple(x.values()) for x in data]
 
-    sql_ops.insert_many(table_name, data)
+def _encode_parsed_data(model:type[CoreDataModel], data:list[CoreDataModel], constants:dict | None = None) -> tuple[list[tuple], list[str]]:
+    """Encodes validated models as rows for the table derived from given model class.
+    Constants are written to the corresponding columns of all rows, e.g. cache ids.
+    Columns are returned explicitly, so values never depend on the physical column order of the table."""
+
+    constants = constants or dict()
+    columns = tuple(c for c in table_columns(model) if c not in constants)
+    rows = models_to_rows(data, columns, constants)
+    return rows, list(columns) + list(constants)
 
 
 def _match_cache_model(data_model_class:CoreDataModel) -> CoreDataModel:
@@ -57,14 +177,22 @@ def _match_cache_model(data_model_class:CoreDataModel) -> CoreDataModel:
 
 
 def cache_data(model:CoreDataModel, data:list[CoreDataModel], cache_id:UUID, timestamp:datetime) -> None:
+    cache_data_many([(model, data)], cache_id, timestamp)
+
+
+def cache_data_many(imports:list[tuple[CoreDataModel, list[CoreDataModel]]], cache_id:UUID, timestamp:datetime) -> None:
+    """Caches data of multiple imports, given as pairs of model and data, within one transaction"""
 
-    cache_model = _match_cache_model(model)
-    table_name = cache_model.table_name
     cache_fields = {"cache_id": cache_id, "cache_timestamp": timestamp}
     
-    data = (model.model_dump(round_trip=True) | cache_fields for model in data)
-    data = [cache_model.model_validate(model) for model in data]
-    _insert_parsed_data(table_name, data)
+    inserts = list()
+    for model, data in imports:
+        cache_model = _match_cache_model(model)
+        # data was already validated, cache fields are simply appended to each row
+        rows, columns = _encode_parsed_data(cache_model, data, cache_fields)
+        inserts.append((cache_model.table_name, rows, columns))
+
+    sql_ops.insert_many_in_transaction(inserts)
 
 
 def get_data_from_cache(model:CoreDataModel, cache_id:UUID, source:str | None = None) -> list[dict]:
@@ -81,11 +209,94 @@ def get_data_from_cache(model:CoreDataModel, cache_id:UUID, source:str | None =
         sql += f" AND source = '{source}';"
     
     params = dict()
-    records = sql_ops.fetch_all_as_dicts(sql, params)
+    records = sql_ops.fetch_all_as_dicts_staged(sql, params)
 
     return records
 
 
+def count_cached(model:CoreDataModel, cache_id:UUID, source:str | None = None) -> int:
+    cache_filter, params = _cache_filter(cache_id, source)
+    sql = f"SELECT COUNT(*) FROM {_match_cache_model(model).table_name} WHERE {cache_filter};"
+    return sql_ops.fetch_staged(sql, params)[0]
+
+
+def sample_from_cache(model:CoreDataModel, cache_id:UUID, n:int, columns:list[str], source:str | None = None) -> list[dict]:
+    """Returns up to n distinct random rows of given columns from the cache.
+    Instead of sorting all cached rows randomly, random rowids are picked between the smallest
+    and largest rowid of the cache. Each is resolved to the next cached row through the cache_id index,
+    so the cost does not grow with the size of the import. Rows are returned in order of caching."""
+
+    table = _match_cache_model(model).table_name
+    cache_filter, params = _cache_filter(cache_id, source)
+
+    sql = f"SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM {table} WHERE {cache_filter};"
+    min_rowid, max_rowid, n_rows = sql_ops.fetch_staged(sql, params)
+    if n_rows <= n:
+        return [_without_rowid(r) for r in page_from_cache(model, cache_id, columns, n, source=source)]
+
+    sql = f"""SELECT rowid, {", ".join(columns)} FROM {table} 
+        WHERE {cache_filter} AND rowid >= ? ORDER BY rowid LIMIT 1;"""
+
+    samples = dict()
+    for _ in range(10 * n): # rowids of other caches in between may be hit repeatedly, hence several attempts
+        if len(samples) == n:
+            break
+        rowid = random.randint(min_rowid, max_rowid)
+        row = sql_ops.fetch_all_as_dicts_staged(sql, params + [rowid])[0]
+        samples[row["rowid"]] = row
+
+    return [_without_rowid(samples[k]) for k in sorted(samples)]
+
+
+def page_from_cache(model:CoreDataModel, cache_id:UUID, columns:list[str], limit:int, 
+    after_rowid:int | None = None, source:str | None = None) -> list[dict]:
+    """Returns up to limit rows of given columns from the cache in order of caching, plus their rowid.
+    Pages are read by passing the last rowid of the previous page as after_rowid (keyset pagination),
+    which keeps the cost per page constant, unlike an OFFSET."""
+
+    table = _match_cache_model(model).table_name
+    cache_filter, params = _cache_filter(cache_id, source)
+    if after_rowid is not None:
+        cache_filter += " AND rowid > ?"
+        params.append(after_rowid)
+
+    sql = f"""SELECT rowid, {", ".join(columns)} FROM {table} 
+        WHERE {cache_filter} ORDER BY rowid LIMIT ?;"""
+    params.append(limit)
+
+    return sql_ops.fetch_all_as_dicts_staged(sql, params)
+
+
+def _cache_filter(cache_id:UUID, source:str | None) -> tuple[str, list]:
+    cache_filter, params = "cache_id = ?", [str(cache_id)]
+    if source is not None:
+        cache_filter += " AND source = ?"
+        params.append(source)
+    return cache_filter, params
+
+
+def _without_rowid(row:dict) -> dict:
+    row.pop("rowid")
+    return row
+
+
+def count_cached_by_month(model:CoreDataModel, cache_id:UUID, source:str | None = None) -> dict[str, int]:
+    """Counts cached rows per month (as 'YYYY-MM'), used to report the progress of bulk imports"""
+
+    cache_model = _match_cache_model(model)
+    table = cache_model.table_name
+    month = f"substr({model.primary_date}, 1, 7)"
+
+    sql = f"SELECT {month}, COUNT(*) FROM {table} WHERE cache_id = ?"
+    params = [str(cache_id)]
+    if source is not None:
+        sql += " AND source = ?"
+        params.append(source)
+    sql += f" GROUP BY {month};"
+
+    return dict(sql_ops.fetch_all_staged(sql, params))
+
+
 def store_data(model:CoreDataModel, cache_id:UUID, min_date:date, max_date:date) -> int:
 
     """Stores data into a table derived from the CoreDataModel.
@@ -99,6 +310,39 @@ def store_data(model:CoreDataModel, cache_id:UUID, min_date:date, max_date:date)
     The data in given date range is deleted completely before writing from cache.
     """
 
+    return store_data_many([model], cache_id, min_date, max_date)[0]
+
+
+def store_data_many(models:list[CoreDataModel], cache_id:UUID, min_date:date, max_date:date) -> list[int]:
+    """Stores cached data of several models in one transaction, see store_data.
+    Used to confirm an import of multiple files, so that either all or none of them are stored.
+    Returns the number of stored rows per model."""
+
+    n_rows_per_model = list()
+    sql_script = ""
+
+    for model in models:
+        n_rows, sql_store = _sql_store_data(model, cache_id, min_date, max_date)
+        n_rows_per_model.append(n_rows)
+        sql_script += sql_store
+
+    # all statements run in one transaction, so that derived tables never diverge from stored data.
+    # the persisted data version is incremented along with them
+    if sql_script:
+        sql_script += f"""INSERT INTO {Metadata.table_name}(key, value) VALUES ('data_version', 1)
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;"""
+        sql_ops.execute_script("BEGIN;" + sql_script + "COMMIT;")
+
+        # invalidates cached results and ETags covering the overwritten dates
+        data_versions.bump(min_date, max_date, get_data_version())
+
+    return n_rows_per_model
+
+
+def _sql_store_data(model:CoreDataModel, cache_id:UUID, min_date:date, max_date:date) -> tuple[int, str]:
+    """Returns the number of cached rows and the sql statements storing them.
+    The statements are empty if no cached data exists (anymore)."""
+
     cache_model = _match_cache_model(model)
     
     # derive relevant table names and filter statements for sql
@@ -106,29 +350,54 @@ def store_data(model:CoreDataModel, cache_id:UUID, min_date:date, max_date:date)
     columns = ", ".join(model.model_fields.keys())
     cache_table = cache_model.table_name
     cache_filter = f"cache_id = '{cache_id}'"
-    # CAUTION: DATE() ensures last date is inclusive for datetimes of that date: https://stackoverflow.com/questions/29971762/sqlite-database-select-the-data-between-two-dates
-    date_filter = f"DATE({model.primary_date}) BETWEEN '{min_date.isoformat()}' AND '{max_date.isoformat()}'"
+    # CAUTION: the date column holds DATE(primary_date), which ensures last date is inclusive for datetimes of that date: https://stackoverflow.com/questions/29971762/sqlite-database-select-the-data-between-two-dates
+    # Filtering on the (indexed) date column directly instead of wrapping primary_date in DATE() avoids full table scans
+    date_range = f"BETWEEN '{min_date.isoformat()}' AND '{max_date.isoformat()}'"
+    date_filter = f"{model.date_column} {date_range}"
 
     # check if cached data exists and proceed acccordingly
     sql = f"SELECT COUNT(*) FROM {cache_table} WHERE {cache_filter}" 
-    result = sql_ops.fetch(sql)
+    result = sql_ops.fetch_staged(sql)
     n_rows = result[0]
 
     # delete and overwrite data in given date range ONLY if cached data still exists
-    if n_rows > 0:
+    if n_rows == 0:
+        return n_rows, ""
       
-        sql_delete_data = f"DELETE FROM {table} WHERE {date_filter};"
+    sql_delete_data = f"DELETE FROM {table} WHERE {date_filter};"
+
+    sql_insert_data = f"""INSERT INTO {table}({columns})
+        SELECT {columns} FROM {cache_table} WHERE {cache_filter};"""
+
+    sql_delete_cache = f"DELETE FROM {cache_table} WHERE {cache_filter};"
 
-        sql_insert_data = f"""INSERT INTO {table}({columns})
-            SELECT {columns} FROM {cache_table} WHERE {cache_filter};"""
+    # tables derived from the stored data have to be updated before the cache is deleted
+    sql_delete_derived, sql_insert_derived = _sql_sync_derived_tables(model, cache_filter, date_filter, date_range)
 
-        sql_delete_cache = f"DELETE FROM {cache_table} WHERE {cache_filter};"
+    sql_script = sql_delete_derived + sql_delete_data \
+        + sql_insert_data + sql_insert_derived \
+        + sql_delete_cache
 
-        sql_script = sql_delete_data + sql_insert_data + sql_delete_cache
+    return n_rows, sql_script
 
-        sql_ops.execute_script(sql_script)
-  
-    return n_rows
+
+def _sql_sync_derived_tables(model:CoreDataModel, cache_filter:str, date_filter:str, date_range:str) -> tuple[str, str]:
+    """Returns sql statements deleting derived rows of the data to be overwritten 
+    and inserting derived rows of the cached data. Both are empty if nothing is derived from the model."""
+
+    match model.__qualname__:
+        case Event.__qualname__:
+            derived_table = EventCategory.table_name
+            sql_delete = f"""DELETE FROM {derived_table} 
+                WHERE event_id IN (SELECT id FROM {Event.table_name} WHERE {date_filter});"""
+            sql_insert = f"""INSERT INTO {derived_table}(event_id, source, category)
+                SELECT e.id, e.source, c.value FROM {EventCache.table_name} e, json_each(e.categories) c 
+                WHERE {cache_filter};"""
+            # daily minutes depend on the event categories and are therefore refreshed last
+            sql_insert += "".join(_sql_refresh_daily_cost_unit_minutes(date_range))
+            return sql_delete, sql_insert
+        case _:
+            return "", ""
 
 
 def delete_cache(model:CoreDataModel, cache_id:UUID) -> None:
@@ -143,14 +412,65 @@ def delete_cache(model:CoreDataModel, cache_id:UUID) -> None:
     sql_ops.execute(sql)
 
 
-def clean_cache_by_age(max_age_in_minutes:int, cache_models:list[CoreDataModel] = CORE_DATA_CACHES) -> None:
+def clean_cache_by_age(max_age_in_minutes:int, cache_models:list[CoreDataModel] = CORE_DATA_CACHES) -> dict[str, int]:
+    """Deletes cached rows older than given age. Returns the number of deleted rows per cache table."""
 
     cutoff_datetime = datetime.now() - timedelta(minutes=max_age_in_minutes)
 
+    deleted = dict()
     for model in cache_models:
         table_name = model.table_name
         primary_date = model.primary_date
 
         sql = f"""DELETE FROM {table_name} 
             WHERE {primary_date} < '{cutoff_datetime.isoformat()}'"""
-        sql_ops.execute(sql)
\ No newline at end of file
+        deleted[table_name] = sql_ops.execute(sql)
+
+    return deleted
+
+
+def get_cache_usage(cache_models:list[CoreDataModel] = CORE_DATA_CACHES) -> list[tuple[str, str, int, int]]:
+    """Returns (cache_id, cache_timestamp, rows, bytes) per cache id over all cache tables, oldest first.
+    Bytes are the summed lengths of the stored values, an estimate of the space used on disk."""
+
+    selects = list()
+    for model in cache_models:
+        value_bytes = " + ".join(f'IFNULL(LENGTH(CAST("{c}" AS BLOB)), 0)' for c in table_columns(model))
+        selects.append(f"""SELECT cache_id, MIN({model.primary_date}) AS cache_timestamp, 
+            COUNT(*) AS n_rows, SUM({value_bytes}) AS n_bytes 
+            FROM {model.table_name} GROUP BY cache_id""")
+
+    sql = f"""SELECT cache_id, MIN(cache_timestamp), SUM(n_rows), SUM(n_bytes) 
+        FROM ({" UNION ALL ".join(selects)}) 
+        GROUP BY cache_id ORDER BY MIN(cache_timestamp);"""
+
+    return sql_ops.fetch_all_staged(sql)
+
+
+def clean_cache_by_budget(max_rows:int, max_bytes:int, cache_models:list[CoreDataModel] = CORE_DATA_CACHES) -> dict[str, int]:
+    """Deletes the oldest caches until all cache tables together hold no more than max_rows and max_bytes.
+    Caches are always deleted as a whole, since a partially deleted import can not be confirmed anymore.
+    Returns the number of deleted rows per cache table."""
+
+    usage = get_cache_usage(cache_models)
+    total_rows = sum(u[2] for u in usage)
+    total_bytes = sum(u[3] for u in usage)
+
+    evicted = list()
+    for cache_id, _, n_rows, n_bytes in usage:
+        if total_rows <= max_rows and total_bytes <= max_bytes:
+            break
+        evicted.append(cache_id)
+        total_rows -= n_rows
+        total_bytes -= n_bytes
+
+    deleted = {model.table_name: 0 for model in cache_models}
+    if len(evicted) == 0:
+        return deleted
+
+    placeholders = ", ".join(["?"] * len(evicted))
+    for model in cache_models:
+        sql = f"DELETE FROM {model.table_name} WHERE cache_id IN ({placeholders});"
+        deleted[model.table_name] = sql_ops.execute(sql, evicted)
+
+    return deleted
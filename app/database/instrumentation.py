@@ -0,0 +1,153 @@
+import re
+import sqlite3
+import logging
+import threading
+from time import perf_counter
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of latency histogram buckets in milliseconds, the last bucket catches everything above
+HISTOGRAM_BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000]
+
+# statements are grouped by template, i.e. with literals replaced by placeholders,
+# since most sql in this app is built with f-strings containing ids and dates
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql:str) -> str:
+    """Derives a statement template by replacing literals with '?' and collapsing whitespace"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?, ...)", sql)
+    sql = _WHITESPACE.sub(" ", sql)
+    return sql.strip()
+
+
+class QueryMetrics:
+    """Thread safe collection of call counts, row counts and latency histograms per statement template"""
+
+    def __init__(self, slow_query_threshold_ms:float):
+        self.slow_query_threshold_ms = slow_query_threshold_ms
+        self._lock = threading.Lock()
+        self._stats = dict()
+
+    def record(self, sql:str, elapsed_ms:float, rows:int) -> None:
+        
+        template = normalize_sql(sql)
+        
+        with self._lock:
+            stats = self._stats.get(template)
+            if stats is None:
+                stats = {
+                    "calls": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "histogram": [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+                }
+                self._stats[template] = stats
+            stats["calls"] += 1
+            stats["rows"] += max(rows, 0)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["histogram"][bisect_left(HISTOGRAM_BUCKETS_MS, elapsed_ms)] += 1
+
+        if elapsed_ms >= self.slow_query_threshold_ms:
+            logger.warning("Slow query (%.1f ms, %d rows): %s", elapsed_ms, rows, template)
+
+    def snapshot(self) -> list[dict]:
+        """Returns statistics per statement template, sorted by total time spent"""
+
+        bucket_labels = [f"<={b}ms" for b in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+        
+        with self._lock:
+            items = [(template, dict(stats)) for template, stats in self._stats.items()]
+
+        result = list()
+        for template, stats in items:
+            stats["statement"] = template
+            stats["mean_ms"] = stats["total_ms"] / stats["calls"]
+            stats["histogram"] = dict(zip(bucket_labels, stats["histogram"]))
+            result.append(stats)
+
+        result.sort(key=lambda s: s["total_ms"], reverse=True)
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class InstrumentedCursor:
+    """Wraps a sqlite3 cursor and records each statement in QueryMetrics.
+    Time spent fetching is attributed to the statement executed last,
+    so the recorded latency covers execution and data transfer alike.
+    A statement is recorded once the next statement runs or the cursor is closed."""
+
+    def __init__(self, cursor:sqlite3.Cursor, metrics:QueryMetrics):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def _run(self, sql:str, method, *args):
+        self._flush()
+        start = perf_counter()
+        method(sql, *args)
+        self._pending = {"sql": sql, "elapsed": perf_counter() - start, "rows": None}
+        return self
+
+    def _fetch(self, method, *args):
+        start = perf_counter()
+        result = method(*args)
+        if self._pending is not None:
+            self._pending["elapsed"] += perf_counter() - start
+            n_rows = (result is not None) if method == self._cursor.fetchone else len(result)
+            self._pending["rows"] = (self._pending["rows"] or 0) + n_rows
+        return result
+
+    def _flush(self) -> None:
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        rows = pending["rows"] if pending["rows"] is not None else self._cursor.rowcount
+        self._metrics.record(pending["sql"], pending["elapsed"] * 1000, rows)
+
+    def execute(self, sql:str, *args):
+        return self._run(sql, self._cursor.execute, *args)
+
+    def executemany(self, sql:str, *args):
+        return self._run(sql, self._cursor.executemany, *args)
+
+    def executescript(self, sql_script:str):
+        return self._run(sql_script, self._cursor.executescript)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def close(self) -> None:
+        self._flush()
+        self._cursor.close()
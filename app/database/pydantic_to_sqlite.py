@@ -1,6 +1,11 @@
 from pydantic import BaseModel
 from pydantic.fields import FieldInfo
+from pydantic_core import to_jsonable_python
 from types import UnionType
+from functools import cache
+from operator import itemgetter
+from typing import Callable
+import re
 import app.database.sqlite_operations as sql_ops
 
 PYDANTIC_TO_SQLITE_MAP = {
@@ -18,12 +23,11 @@ PYDANTIC_TO_SQLITE_MAP = {
     "UUID": "TEXT" 
 }
 
-def create_table_from_pydantic(table_name:str, model:BaseModel, primary_key:str, drop_if_exists:bool=False) -> None:
-    """Create sqlite table from pydantic model. Columns are declared in order of model fields"""
+def create_table_from_pydantic(table_name:str, model:BaseModel, primary_key:str | None, drop_if_exists:bool=False) -> None:
+    """Create sqlite table from pydantic model, unless it exists already. 
+    Columns are declared in order of model fields, followed by generated columns declared on the model"""
     
-    fields = [_parse_field(f, i, primary_key) for f, i in model.model_fields.items()]
-    fields = ", ".join(fields)
-    sql_create_table = f"CREATE TABLE {table_name} (\n{fields}\n);"
+    sql_create_table = sql_create_table_from_pydantic(table_name, model, primary_key)
     
     if drop_if_exists:
         sql_drop_if_exists = f"DROP TABLE IF EXISTS {table_name};"
@@ -33,7 +37,34 @@ def create_table_from_pydantic(table_name:str, model:BaseModel, primary_key:str,
         sql_ops.execute(sql_create_table)
 
 
-def _parse_field(field: str, info: FieldInfo, primary_key:str) -> str:
+@cache
+def table_columns(model:type[BaseModel]) -> tuple[str, ...]:
+    """Columns of the table derived from the model, in order of declaration. 
+    Excludes generated columns, as they can not be inserted into"""
+    return tuple(model.model_fields.keys())
+
+
+@cache
+def _row_getter(columns:tuple[str, ...]) -> Callable[[dict], tuple]:
+    """Returns a function picking values of given columns from a dict, always as a tuple"""
+    if len(columns) == 1:
+        return lambda d: (d[columns[0]],)
+    return itemgetter(*columns)
+
+
+def models_to_rows(data:list[BaseModel], columns:tuple[str, ...], constants:dict | None = None) -> list[tuple]:
+    """Encodes validated models as tuples of values in given column order, ready for inserting.
+    Dumping in json mode turns types like datetime or UUID into strings and, with round_trip=True,
+    Json fields into json strings, all in one pass without serializing to and parsing from json text.
+    Constants, e.g. cache ids, are encoded once and appended to each row after the model columns."""
+    
+    get_row = _row_getter(tuple(columns))
+    constants = tuple(to_jsonable_python(v) for v in (constants or dict()).values())
+    
+    return [get_row(x.model_dump(mode="json", round_trip=True)) + constants for x in data]
+
+
+def _parse_field(field: str, info: FieldInfo, primary_key:str | None) -> str:
     """Translates a pydantic field info to a sqlite column constraint"""    
     
     annotation = info.annotation
@@ -61,4 +92,54 @@ def _parse_field(field: str, info: FieldInfo, primary_key:str) -> str:
         result += " NOT NULL" # in sqlite, even primary keys can be null, which I assume is not desired for typical use cases
     if field == primary_key:
         result += " PRIMARY KEY"
-    return result
\ No newline at end of file
+    return result
+
+
+def add_missing_generated_columns(table_name:str, model:BaseModel) -> None:
+    """Adds generated columns declared on the model to an existing table created by an earlier version.
+    Sqlite can only add VIRTUAL generated columns to existing tables, not STORED ones.
+    Indexes on virtual columns store the computed values nonetheless, so lookups are just as fast."""
+
+    existing_columns = {row[1] for row in sql_ops.fetch_all(f"PRAGMA table_xinfo({table_name});")}
+
+    for column in getattr(model, "generated_columns", []):
+        if column.name not in existing_columns:
+            column = _parse_generated_column(column, "VIRTUAL")
+            sql_ops.execute(f"ALTER TABLE {table_name} ADD COLUMN {column};")
+
+
+def create_indexes_from_pydantic(table_name:str, model:BaseModel) -> None:
+    """Creates all indexes declared on the model, unless they exist already."""
+    for sql in sql_create_indexes_from_pydantic(table_name, model):
+        sql_ops.execute(sql)
+
+
+def sql_create_table_from_pydantic(table_name:str, model:BaseModel, primary_key:str | None) -> str:
+    """Returns the statement used by create_table_from_pydantic"""
+    fields = [_parse_field(f, model.model_fields[f], primary_key) for f in table_columns(model)]
+    fields += [_parse_generated_column(c, "STORED") for c in getattr(model, "generated_columns", [])]
+    fields = ", ".join(fields)
+    return f"CREATE TABLE IF NOT EXISTS {table_name} (\n{fields}\n);"
+
+
+def sql_create_indexes_from_pydantic(table_name:str, model:BaseModel) -> list[str]:
+    """Returns the statements used by create_indexes_from_pydantic.
+    Index names are derived from table name and indexed columns or expressions.
+    For tables of attached databases ("schema.table"), the index is created in the same schema."""
+
+    schema, _, table = table_name.rpartition(".")
+    schema = f"{schema}." if schema else ""
+
+    statements = list()
+    for index in getattr(model, "indexes", []):
+        columns = ", ".join(index.columns)
+        index_name = "_".join(["idx", table] + index.columns)
+        index_name = re.sub(r"\W+", "_", index_name).strip("_").lower()
+        unique = "UNIQUE " if index.unique else ""
+        statements.append(f"CREATE {unique}INDEX IF NOT EXISTS {schema}{index_name} ON {table} ({columns});")
+    return statements
+
+
+def _parse_generated_column(column, storage:str) -> str:
+    """Translates a generated column declaration to a sqlite column definition"""
+    return f"{column.name} {column.storage_class} GENERATED ALWAYS AS ({column.expression}) {storage}"
\ No newline at end of file
@@ -0,0 +1,43 @@
+from pathlib import Path
+import threading
+
+
+class AggTimeByCostUnitQuery:
+    """Builds the aggregation sql for agg_time_by_cost_unit from its template.
+    The template is read once and the pivot statements derived from the configured cost units
+    are only rebuilt when the cost units change. Handing out the very same sql string 
+    on every request allows sqlite3 to reuse the prepared statement from its per-connection statement cache."""
+
+    def __init__(self, template_filepath:Path):
+        with open(template_filepath, "r", encoding="utf-8") as f:
+            self._template = f.read()
+        self._lock = threading.Lock()
+        self._cost_units = None
+        self._sql = None
+
+    def sql(self, cost_units:list[str]) -> str:
+        """Returns the ready to execute sql for given cost unit names, in pivot column order"""
+        cost_units = tuple(cost_units)
+        with self._lock:
+            if cost_units != self._cost_units:
+                self._sql = self._build(cost_units)
+                self._cost_units = cost_units
+            return self._sql
+
+    def _build(self, cost_units:tuple[str]) -> str:
+
+        # insert dynamic sql statements based on cost units in configuration
+        sql_pivot_statements = list()
+        sql_sum_columns = list()
+
+        for cost_unit in cost_units:
+            sql_pivot_statements.append(f"MAX(CASE WHEN cost_unit = '{cost_unit}' THEN event_time_in_cost_unit ELSE 0 END) AS '{cost_unit}'")
+            sql_sum_columns.append(f"e.{cost_unit}")
+
+        sql_pivot_statements = ", ".join(sql_pivot_statements)        
+        sql_sum_columns = " + ".join(sql_sum_columns)
+
+        return self._template.format(
+            sql_pivot_statements = sql_pivot_statements,
+            sql_sum_columns = sql_sum_columns
+        )
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class ResultCache:
+    """Thread safe LRU cache for query results, i.e. lists of dicts.
+    Memory is bounded by the number of entries as well as the total number of rows cached.
+    Results are copied on the way in and out, so callers may modify them freely."""
+
+    def __init__(self, max_entries:int = 128, max_rows:int = 100_000):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, list[dict]] = OrderedDict()
+        self._rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key:Hashable) -> list[dict] | None:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(row) for row in result]
+
+    def put(self, key:Hashable, result:list[dict]) -> None:
+        
+        if len(result) > self.max_rows:
+            return
+        result = [dict(row) for row in result]
+        
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._rows -= len(previous)
+            self._entries[key] = result
+            self._rows += len(result)
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                _, evicted = self._entries.popitem(last=False)
+                self._rows -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, predicate:Callable[[Hashable], bool] | None = None) -> int:
+        """Removes all entries, or only those whose key matches the predicate. Returns the number of removed entries"""
+        with self._lock:
+            keys = [k for k in self._entries if predicate is None or predicate(k)]
+            for key in keys:
+                self._rows -= len(self._entries.pop(key))
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries), "rows": self._rows,
+                "max_entries": self.max_entries, "max_rows": self.max_rows,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions
+            }
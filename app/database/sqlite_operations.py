@@ -1,62 +1,180 @@
 import sqlite3
+import threading
+import atexit
 from contextlib import contextmanager
+from typing import Iterator
 from app.config import parse_config
+from app.database.instrumentation import QueryMetrics, InstrumentedCursor
+from app.models import STAGING_SCHEMA
 from pathlib import Path
 
 CONFIG = parse_config()
 DATABASE = Path(CONFIG.database_path) / CONFIG.database_name
 
+# opt-in query metrics, None if disabled
+METRICS = None
+if CONFIG.sql_instrumentation.enabled:
+    METRICS = QueryMetrics(CONFIG.sql_instrumentation.slow_query_threshold_ms)
+
+# ---------------------------------------------------------------------------------------
+# Connection Pool
+#   - connections are opened once and reused instead of connecting per operation,
+#     which saves the connect, schema load and page cache warmup on every call
+#   - each thread gets its own reader connection, all writes share one writer connection
+#     guarded by a lock, since sqlite only supports a single writer at a time anyway
+#   - WAL journaling lets readers proceed while the writer commits:
+#       https://www.sqlite.org/wal.html
+# ---------------------------------------------------------------------------------------
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL", # safe in WAL mode, only the last commits may be lost on power failure
+    "mmap_size": 268435456, # 256 MiB
+    "cache_size": -16000, # negative values are interpreted as KiB, i.e. 16 MB
+    "busy_timeout": 5000, # milliseconds to wait for a lock before raising "database is locked"
+    "temp_store": "MEMORY"
+}
+
+_local = threading.local()
+_generation = 0 # incremented on close_connections() to invalidate thread local readers
+_writer = None
+_writer_lock = threading.Lock()
+_connections = list()
+_connections_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    """Opens a new connection and applies all pragmas.
+    Connections may be closed from other threads on shutdown, hence check_same_thread=False.
+    Apart from that, reader connections are only used by the thread that opened them."""
+    conn = sqlite3.connect(DATABASE, check_same_thread=False)
+    for pragma, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {pragma} = {value};")
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+def _get_reader() -> sqlite3.Connection:
+    if getattr(_local, "generation", None) != _generation:
+        _local.reader = _connect()
+        _local.generation = _generation
+    return _local.reader
+
+
+def _get_writer() -> sqlite3.Connection:
+    """Must be called while holding _writer_lock"""
+    global _writer
+    if _writer is None:
+        _writer = _connect()
+        _attach_staging(_writer)
+    return _writer
+
+# ---------------------------------------------------------------------------------------
+# Staging Store
+#   - imports are staged in a separate database attached to the writer connection only,
+#     so that short lived cache rows are neither written to nor journaled in the main database file
+#   - "memory" keeps staged data in RAM, "temp_file" in a temporary file deleted on close.
+#     Either way, staged data is lost when the connection is closed, e.g. on restart
+#   - since readers can not see the staging store, staged data is read through the writer as well
+# ---------------------------------------------------------------------------------------
+
+STAGING_FILES = {"memory": ":memory:", "temp_file": ""} # an empty file name makes sqlite create a temporary file
+STAGING_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF" # staged data does not need to survive crashes
+}
+
+_staging_schema_sql = ""
+
+
+def _attach_staging(conn:sqlite3.Connection) -> None:
+    conn.execute(f"ATTACH DATABASE '{STAGING_FILES[CONFIG.staging_store]}' AS {STAGING_SCHEMA};")
+    for pragma, value in STAGING_PRAGMAS.items():
+        conn.execute(f"PRAGMA {STAGING_SCHEMA}.{pragma} = {value};")
+    conn.executescript(_staging_schema_sql)
+
+
+def set_staging_schema(sql_script:str) -> None:
+    """Sets the statements creating the staging tables. 
+    They are run right away and whenever the writer connection is reopened."""
+    global _staging_schema_sql
+    with _writer_lock:
+        _staging_schema_sql = sql_script
+        _get_writer().executescript(sql_script)
+
+
+def close_connections() -> None:
+    """Closes all pooled connections. They are reopened lazily on next use."""
+    global _writer, _generation
+    with _writer_lock, _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+        _writer = None
+        _generation += 1
+
+atexit.register(close_connections)
+
 # ---------------------------------------------------------------------------------------
 # Custom Context Managers: https://stackoverflow.com/questions/67436362/decorator-for-sqlite3
 #   - default context manager not working as expected with sqlite, connections are not closed: 
 #       https://blog.rtwilson.com/a-python-sqlite3-context-manager-gotcha/
 #   - Why is the cursor yielded in below context managers?
 #       This is required by with statements: https://docs.python.org/3/library/contextlib.html
+#   - pooled connections stay open, only the cursor is closed after each operation
+#   - with sql instrumentation enabled, cursors are wrapped to record query metrics
 # ---------------------------------------------------------------------------------------
 
+def _cursor(conn:sqlite3.Connection) -> sqlite3.Cursor | InstrumentedCursor:
+    cur = conn.cursor()
+    if METRICS is not None:
+        cur = InstrumentedCursor(cur, METRICS)
+    return cur
+
+
 @contextmanager
 def read_manager():  
-    conn = sqlite3.connect(DATABASE)
-    conn.set_trace_callback(print)
+    conn = _get_reader()
+    cur = _cursor(conn)
     try:
-        cur = conn.cursor()
         yield cur 
     except Exception as e:
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        cur.close()
 
 
 @contextmanager
 def read_manager_row_factory(): 
-    conn = sqlite3.connect(DATABASE)
-    conn.set_trace_callback(print)
-    conn.row_factory = sqlite3.Row
+    conn = _get_reader()
+    cur = _cursor(conn)
+    cur.row_factory = sqlite3.Row
     try:
-        cur = conn.cursor()
         yield cur 
     except Exception as e:
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        cur.close()
 
 
 @contextmanager
 def write_manager(): 
-    conn = sqlite3.connect(DATABASE)
-    conn.set_trace_callback(print)
-    try:
-        cur = conn.cursor()
-        yield cur
-    except Exception as e:
-        conn.rollback()
-        raise e
-    else:
-        conn.commit()
-    finally:
-        conn.close()
+    with _writer_lock:
+        conn = _get_writer()
+        cur = _cursor(conn)
+        try:
+            yield cur
+        except Exception as e:
+            conn.rollback()
+            raise e
+        else:
+            conn.commit()
+        finally:
+            cur.close()
+
 
 # ---------------------------------------------------------------------------------------
 # READ ONLY OPERATIONS
@@ -70,9 +188,9 @@ def create_db() -> None:
         return
     
 
-def fetch(sql:str) -> tuple:
+def fetch(sql:str, params:dict | tuple = ()) -> tuple:
     with read_manager() as cur: 
-        record = cur.execute(sql).fetchone()
+        record = cur.execute(sql, params).fetchone()
     return record
 
 
@@ -82,9 +200,9 @@ def fetch_as_dict(sql:str) -> dict:
     return dict(record)
 
 
-def fetch_all(sql:str) -> list[tuple]:
+def fetch_all(sql:str, params:dict | tuple = ()) -> list[tuple]:
     with read_manager() as cur: 
-        records = cur.execute(sql).fetchall()
+        records = cur.execute(sql, params).fetchall()
     return records
 
 
@@ -93,13 +211,56 @@ def fetch_all_as_dicts(sql:str, params:dict) -> list[dict]:
         records = cur.execute(sql, params).fetchall()
     return [dict(r) for r in records]
 
+
+def iter_batches(sql:str, params:dict | tuple = (), batch_size:int = 1000) -> Iterator[list[tuple]]:
+    """Yields the result in batches of rows, keeping memory constant for results of any size.
+    Uses a dedicated connection, which is closed when the generator is exhausted or closed.
+    Unlike pooled readers, the generator can therefore be advanced from changing threads,
+    e.g. by the executors of the async facade, as long as it is not advanced concurrently."""
+    conn = _connect()
+    cur = _cursor(conn)
+    try:
+        cur.execute(sql, params)
+        while batch := cur.fetchmany(batch_size):
+            yield batch
+    finally:
+        cur.close()
+        conn.close()
+        with _connections_lock:
+            if conn in _connections:
+                _connections.remove(conn)
+
+
+def fetch_staged(sql:str, params:dict | tuple = ()) -> tuple:
+    """Like fetch, for queries on the staging store"""
+    with write_manager() as cur:
+        record = cur.execute(sql, params).fetchone()
+    return record
+
+
+def fetch_all_staged(sql:str, params:dict | tuple = ()) -> list[tuple]:
+    """Like fetch_all, for queries on the staging store"""
+    with write_manager() as cur:
+        records = cur.execute(sql, params).fetchall()
+    return records
+
+
+def fetch_all_as_dicts_staged(sql:str, params:dict | tuple = ()) -> list[dict]:
+    """Like fetch_all_as_dicts, for queries on the staging store"""
+    with write_manager() as cur:
+        cur.row_factory = sqlite3.Row
+        records = cur.execute(sql, params).fetchall()
+    return [dict(r) for r in records]
+
 # ---------------------------------------------------------------------------------------
 # WRITE OPERATIONS
 # ---------------------------------------------------------------------------------------
 
-def execute(sql:str) -> None:
+def execute(sql:str, params:dict | tuple = ()) -> int:
+    """Returns the number of rows modified by the statement"""
     with write_manager() as cur:
-        cur.execute(sql)
+        cur.execute(sql, params)
+        return cur.rowcount
 
 
 def execute_script(sql_script:str) -> None:
@@ -114,9 +275,28 @@ def insert(table_name:str, record:tuple) -> None:
         cur.execute(sql, record)
 
 
-def insert_many(table_name:str, records:list[tuple]) -> None:
-    """Assumes equal length for each tuple in data"""
+def insert_many(table_name:str, records:list[tuple], columns:list[str] | None = None) -> None:
+    """Assumes equal length for each tuple in data. 
+    Without explicit columns, values have to be in the order of the table columns."""
     with write_manager() as cur:
-        placeholders = ", ".join(["?"] * len(records[0]))
-        sql = f"INSERT INTO {table_name} VALUES({placeholders})"
-        cur.executemany(sql, records)
+        _insert_many(cur, table_name, records, columns)
+
+
+def insert_many_in_transaction(inserts:list[tuple[str, list[tuple], list[str] | None]]) -> None:
+    """Inserts records into multiple tables within one transaction.
+    Expects a list of arguments as for insert_many: (table_name, records, columns)"""
+    with write_manager() as cur:
+        for table_name, records, columns in inserts:
+            _insert_many(cur, table_name, records, columns)
+
+
+def _insert_many(cur:sqlite3.Cursor, table_name:str, records:list[tuple], columns:list[str] | None) -> None:
+    if columns is None:
+        n_values = len(records[0])
+        sql_columns = ""
+    else:
+        n_values = len(columns)
+        sql_columns = "(" + ", ".join(columns) + ")"
+    placeholders = ", ".join(["?"] * n_values)
+    sql = f"INSERT INTO {table_name}{sql_columns} VALUES({placeholders})"
+    cur.executemany(sql, records)
\ No newline at end of file
@@ -0,0 +1,41 @@
+from fastapi import Request, Response
+import hashlib
+import json
+
+# ---------------------------------------------------------------------------------------
+# Conditional GET for responses computed from stored data
+#   - the ETag is derived from the path, the query parameters and whatever else the response
+#     depends on, e.g. the data version of the requested date range and the cost unit configuration
+#   - requests sending a matching If-None-Match header get an empty 304 response,
+#     so routes check it before querying data or rendering templates
+#   - Cache-Control: no-cache makes browsers revalidate on every request instead of guessing freshness
+# ---------------------------------------------------------------------------------------
+
+
+def make_etag(request:Request, *validators) -> str:
+    """Weak ETag, as html is rendered with the same content but not necessarily byte by byte identical"""
+    key = [request.url.path, sorted(request.query_params.multi_items()), *validators]
+    digest = hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def is_not_modified(request:Request, etag:str) -> bool:
+    """True if the client already holds the response with given ETag (weak comparison)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def not_modified(etag:str) -> Response:
+    return Response(status_code=304, headers=_headers(etag))
+
+
+def set_etag(response:Response, etag:str) -> Response:
+    response.headers.update(_headers(etag))
+    return response
+
+
+def _headers(etag:str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
@@ -0,0 +1,140 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime
+from typing import Literal
+
+# ---------------------------------------------------------------------------------------
+# Event minutes per date and cost unit, taking overlapping events into account
+#   - events are given as dicts with id, source, start, end, date and cost_unit,
+#     an event mapped to several cost units is given once per cost unit
+#   - policies for time covered by more than one event:
+#       "count_all": every event counts in full, as in the materialized daily_cost_unit_minutes.
+#           Minutes are truncated per event, like the sql aggregation does
+#       "merge": overlapping events of the same cost unit count once (their union),
+#           overlaps of different cost units count for each of them
+#       "source_priority": overlapping time counts once, for the event whose source comes first
+#           in the priority list. Among events of that source, the one that started first wins
+#   - with "merge" and "source_priority", minutes are truncated per date and cost unit
+#   - each date is swept once over the sorted start and end points of its events: O(n log n)
+#   - overlaps are reported regardless of the policy, as the spans of a date covered by
+#     more than one event. Events just touching each other do not overlap
+# ---------------------------------------------------------------------------------------
+
+OverlapPolicy = Literal["count_all", "merge", "source_priority"]
+
+EPOCH = datetime(1970, 1, 1)
+
+# order of points at the same time: ends before starts, so touching events do not overlap
+_END, _START = 0, 1
+
+
+def minutes_by_cost_unit(events:list[dict], policy:OverlapPolicy = "count_all",
+    source_priority:list[str] | None = None) -> tuple[dict[str, dict[str, int]], list[dict]]:
+    """Returns the minutes per date and cost unit, e.g. {"2025-06-02": {"mrh": 90, "cut": 30}},
+    and the overlaps found, see _sweep for their structure."""
+
+    ranks = {source: i for i, source in enumerate(source_priority or [])}
+
+    events_by_date = defaultdict(list)
+    for event in events:
+        events_by_date[event["date"]].append(event)
+
+    minutes = dict()
+    overlaps = list()
+
+    for day in sorted(events_by_date):
+        day_events = events_by_date[day]
+        intervals = [(_seconds(e["start"]), _seconds(e["end"])) for e in day_events]
+
+        seconds, day_overlaps = _sweep(day_events, intervals, policy, ranks)
+        overlaps.extend(day_overlaps)
+
+        if policy == "count_all":
+            # truncated per event, as (unixepoch(end) - unixepoch(start)) / 60 in sql
+            day_minutes = defaultdict(int)
+            for event, (start, end) in zip(day_events, intervals):
+                day_minutes[event["cost_unit"]] += int((end - start) / 60)
+            minutes[day] = dict(day_minutes)
+        else:
+            minutes[day] = {cost_unit: s // 60 for cost_unit, s in seconds.items()}
+
+    return minutes, overlaps
+
+
+def _sweep(events:list[dict], intervals:list[tuple[int, int]], policy:OverlapPolicy,
+    ranks:dict[str, int]) -> tuple[dict[str, int], list[dict]]:
+    """Sweeps over the start and end points of the events of one date.
+    Returns the seconds per cost unit as resolved by the policy (empty for "count_all")
+    and the overlaps, each as {"date", "start", "end", "minutes", "event_ids", "sources", "cost_units"}."""
+
+    points = list()
+    for i, (start, end) in enumerate(intervals):
+        if end > start: # events without duration neither count nor overlap
+            points.append((start, _START, i))
+            points.append((end, _END, i))
+    points.sort()
+
+    seconds = defaultdict(int)
+    active = set()
+    active_per_cost_unit = defaultdict(int)
+    by_priority = list() # heap of (rank, start, index), ended events are removed lazily
+    n_lowest_rank = len(ranks)
+
+    overlaps = list()
+    overlap = None
+    previous = None
+
+    for time, kind, i in points:
+
+        # attribute the span since the previous point to the events active during it
+        if active and time > previous:
+            span = time - previous
+            if policy == "merge":
+                for cost_unit, n_active in active_per_cost_unit.items():
+                    if n_active > 0:
+                        seconds[cost_unit] += span
+            elif policy == "source_priority":
+                while by_priority[0][2] not in active:
+                    heapq.heappop(by_priority)
+                seconds[events[by_priority[0][2]]["cost_unit"]] += span
+            if overlap is not None:
+                overlap["seconds"] += span
+
+        event = events[i]
+        if kind == _START:
+            active.add(i)
+            active_per_cost_unit[event["cost_unit"]] += 1
+            if policy == "source_priority":
+                heapq.heappush(by_priority, (ranks.get(event["source"], n_lowest_rank), intervals[i][0], i))
+            if overlap is not None:
+                overlap["members"].add(i)
+            elif len(active) > 1:
+                overlap = {"start": event["start"], "members": set(active), "seconds": 0}
+        else:
+            active.discard(i)
+            active_per_cost_unit[event["cost_unit"]] -= 1
+            if overlap is not None and len(active) < 2:
+                overlaps.append(_overlap_view(events, overlap, event["end"]))
+                overlap = None
+
+        previous = time
+
+    return seconds, overlaps
+
+
+def _overlap_view(events:list[dict], overlap:dict, end:str) -> dict:
+    members = [events[i] for i in sorted(overlap["members"])]
+    return {
+        "date": members[0]["date"],
+        "start": overlap["start"],
+        "end": end,
+        "minutes": overlap["seconds"] // 60,
+        "event_ids": sorted(set(e["id"] for e in members)),
+        "sources": sorted(set(e["source"] for e in members)),
+        "cost_units": sorted(set(e["cost_unit"] for e in members))
+    }
+
+
+def _seconds(timestamp:str) -> int:
+    """Seconds since epoch of an iso timestamp without timezone, as sqlite's unixepoch()"""
+    return int((datetime.fromisoformat(timestamp) - EPOCH).total_seconds())
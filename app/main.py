@@ -1,13 +1,18 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import uvicorn
 import sys
 sys.path.append(Path(__file__).parents[1].as_posix())
 
-from app.config import parse_config, get_root_path
-from app.routers import agg_time_by_cost_unit, frontend, import_files, rest
-from app.database import db
+from app.config import parse_config, config_service, get_root_path, ConfigSnapshot
+from app.routers import agg_time_by_cost_unit, export, frontend, import_files, rest, sql_metrics
+from app.database import db, cache_janitor
+from app.database.async_db import DatabaseOverloadedError
+from app.startup_profile import step
 
 # -----------------------------------------------------
 # Initiation
@@ -17,30 +22,76 @@ from app.database import db
 CONFIG = parse_config()
 DATABASE = Path(CONFIG.database_path) / CONFIG.database_name
 
-# initiate database
-if DATABASE.is_file():
-    print(f"Database {DATABASE} already exists. Moving on...")
-else:
-    print(f"Creating new database file: {DATABASE}...")
-    DATABASE.parent.mkdir(parents=True, exist_ok=True)
-    db.initiate_db()
-    print("Database created.")
 
-# clean database cache
-MAX_AGE_IN_MINUTES = 20
-print(f"Cleaning cache tables: Deleting rows cached {MAX_AGE_IN_MINUTES} minutes ago or older")
-db.clean_cache_by_age(MAX_AGE_IN_MINUTES)
+def initiate_database() -> None:
+    """Creates the database or migrates existing ones by adding missing tables, columns and indexes.
+    Also rebuilds tables derived from the cost unit configuration if it changed since the last start."""
+
+    if DATABASE.is_file():
+        print(f"Database {DATABASE} already exists. Checking for missing tables and indexes...")
+    else:
+        print(f"Creating new database file: {DATABASE}...")
+        DATABASE.parent.mkdir(parents=True, exist_ok=True)
+    with step("initiate database"):
+        db.initiate_db()
+    print("Database initiated.")
+
+    with step("sync cost units"):
+        if db.sync_cost_units(parse_config().cost_units):
+            print("Cost unit configuration changed. Rebuilt daily minutes per cost unit.")
+
+
+def on_config_reload(old:ConfigSnapshot, new:ConfigSnapshot) -> None:
+    """Rebuilds tables derived from the cost units before a reloaded configuration is swapped in.
+    Aggregations pinning the configuration wait until the swap, so that no request combines
+    the old cost units with tables derived from the new ones, see config.pinned_config"""
+    if new.cost_units_hash != old.cost_units_hash and db.sync_cost_units(new.config.cost_units):
+        print("Cost unit configuration changed. Rebuilt daily minutes per cost unit.")
+
+config_service().subscribe(on_config_reload, before_swap=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+
+    # the database is initiated on startup of the server rather than on import of this module
+    initiate_database()
+
+    # clean database cache periodically while the app is running
+    config = parse_config()
+    janitor = config.cache_janitor
+    print(f"Cleaning cache tables every {janitor.interval_seconds} seconds: Deleting rows cached {janitor.max_age_minutes} minutes ago or older")
+    tasks = [asyncio.create_task(cache_janitor.run_periodically())]
+
+    # apply changes of the configuration file while the app is running
+    if config.config_reload.enabled:
+        interval = config.config_reload.interval_seconds
+        print(f"Checking {config_service().config_path} for changes every {interval} seconds")
+        tasks.append(asyncio.create_task(config_service().watch(interval)))
+
+    yield
+
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
 
 # instantiate api entrypoint, static resources and routers
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 root_path = get_root_path()
 app.mount("/static", StaticFiles(directory=(root_path / "static")), name="static")
 app.mount("/javascript", StaticFiles(directory=(root_path / "javascript")), name="javascript")
 
+@app.exception_handler(DatabaseOverloadedError)
+async def database_overloaded_handler(request: Request, exc: DatabaseOverloadedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 app.include_router(agg_time_by_cost_unit.router)
 app.include_router(import_files.router)
 app.include_router(rest.router)
+app.include_router(export.router)
+app.include_router(sql_metrics.router)
 app.include_router(frontend.router)
 
 # -----------------------------------------------------
@@ -8,13 +8,33 @@ from uuid import UUID, uuid4
 # primary data structures
 # -------------------------------------------------------------------------------
 
+class Index(BaseModel):
+    """Declares a database index on a core data model's table.
+    Columns may also be sql expressions, e.g. "DATE(start)"."""
+    columns: list[str]
+    unique: bool = False
+
+
+class GeneratedColumn(BaseModel):
+    """Declares a stored column computed by sqlite from other columns of the same row.
+    Generated columns are not part of the pydantic model and can not be inserted into."""
+    name: str
+    expression: str
+    storage_class: str = "TEXT"
+
+
 class CoreDataModel(BaseModel):
     """A core data model represents a datastructure that the application 
     revolves around. Aside from validating input data,
-    they are used to derive corresponding database tables."""
+    they are used to derive corresponding database tables.
+    The column in date_column holds the calendar date of primary_date
+    and is used for index-friendly filtering by date ranges."""
     table_name: ClassVar[str]
-    primary_key: ClassVar[str]
+    primary_key: ClassVar[str | None]
     primary_date: ClassVar[str]
+    date_column: ClassVar[str]
+    generated_columns: ClassVar[list[GeneratedColumn]] = []
+    indexes: ClassVar[list[Index]] = []
 
 
 class DayCategories(str, Enum):
@@ -28,7 +48,9 @@ class EZeitDay(CoreDataModel):
     table_name = "ezeit_days"
     primary_key = "id"
     primary_date = "date"
-    id: UUID = Field(default_factory=lambda: uuid4().hex)
+    date_column = "date"
+    indexes = [Index(columns=["date", "id"])] # date lookups and keyset pagination
+    id: UUID = Field(default_factory=uuid4)
     date: date
     booked_minutes: int
     day_category: Literal[
@@ -48,7 +70,16 @@ class Event(CoreDataModel):
     table_name: ClassVar[str] = "events"
     primary_key: ClassVar[str] = "id"
     primary_date: ClassVar[str] = "start"
-    id: UUID = Field(default_factory=lambda: uuid4().hex)
+    date_column: ClassVar[str] = "start_date"
+    generated_columns: ClassVar[list[GeneratedColumn]] = [
+        GeneratedColumn(name="start_date", expression="DATE(start)")
+    ]
+    indexes: ClassVar[list[Index]] = [
+        Index(columns=["start_date"]),
+        Index(columns=["start", "id"]), # keyset pagination
+        Index(columns=["source", "start", "id"])
+    ]
+    id: UUID = Field(default_factory=uuid4)
     start: datetime
     end: datetime
     categories: Json[list[str]]
@@ -59,25 +90,78 @@ class Event(CoreDataModel):
 # secondary data structures
 # -------------------------------------------------------------------------------
 
+STAGING_SCHEMA = "staging" # separate database attached for caching imports, see sqlite_operations
+
 class EZeitDayCache(EZeitDay):
-    """Extension used to cache data in a separate database table"""
+    """Extension used to cache data in a table of the staging store"""
     cache_id: UUID
     cache_timestamp: datetime
-    table_name = EZeitDay.table_name + "_cache"
+    table_name = f"{STAGING_SCHEMA}.{EZeitDay.table_name}_cache"
     primary_date = "cache_timestamp"
+    generated_columns = []
+    indexes = [Index(columns=["cache_id"]), Index(columns=["cache_timestamp"])]
 
 class EventCache(Event):
-    """Extension used to cache data in a separate database table"""
+    """Extension used to cache data in a table of the staging store"""
     cache_id: UUID
     cache_timestamp: datetime
-    table_name = Event.table_name + "_cache"
+    table_name = f"{STAGING_SCHEMA}.{Event.table_name}_cache"
     primary_date = "cache_timestamp"
+    generated_columns = []
+    indexes = [Index(columns=["cache_id", "source"]), Index(columns=["cache_timestamp"])]
+
+
+class EventCategory(CoreDataModel):
+    """Normalized mapping of events to their categories, one row per category.
+    Derived from Event.categories when storing events, so that queries 
+    can join on an index instead of expanding the json array of every event"""
+    table_name = "event_categories"
+    primary_key = None
+    event_id: UUID
+    source: Literal[EventSources.KAPOW, EventSources.OUTLOOK]
+    category: str
+    indexes = [Index(columns=["event_id"]), Index(columns=["source", "category"])]
+
+
+class CostUnitCategory(CoreDataModel):
+    """Mapping of event categories to cost units per event source.
+    Derived from the cost units in the main configuration"""
+    table_name = "cost_unit_categories"
+    primary_key = None
+    cost_unit: str
+    source: Literal[EventSources.KAPOW, EventSources.OUTLOOK]
+    category: str
+    indexes = [Index(columns=["source", "category"])]
+
+
+class DailyCostUnitMinutes(CoreDataModel):
+    """Materialized sum of event minutes per date and cost unit.
+    Updated for the affected date range whenever events are stored 
+    and rebuilt completely when the cost unit configuration changes"""
+    table_name = "daily_cost_unit_minutes"
+    primary_key = None
+    primary_date = "date"
+    date_column = "date"
+    date: date
+    cost_unit: str
+    minutes: int
+    indexes = [Index(columns=["date", "cost_unit"], unique=True)]
+
+
+class Metadata(CoreDataModel):
+    """Key value store for the state of the database itself, e.g. the configuration derived tables were built with"""
+    table_name = "metadata"
+    primary_key = "key"
+    key: str
+    value: str
 
 
 class EZeitDayList(BaseModel):
     """Explicit and extendable list type for REST API"""
     data: list[EZeitDay]
+    next_cursor: str | None = None
 
 class EventList(BaseModel):
     """Explicit and extendable list type for REST API"""
     data: list[Event]
+    next_cursor: str | None = None
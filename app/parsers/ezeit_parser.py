@@ -1,6 +1,7 @@
-from typing import BinaryIO
+from typing import BinaryIO, Iterator
 import datetime as dt
 from calendar import monthrange
+from collections import defaultdict
 from app.models import EZeitDay, DayCategories
 from app.parsers.utils import csv_dict_reader, check_mandatory_columns, add_exception_context
 
@@ -19,6 +20,83 @@ DAY_CATEGORY_MAP = {
 
 def parse_working_hours(file:BinaryIO, month:int, year:int) -> list[EZeitDay]:
 
+    rows = _parse_rows(file)
+
+    # ensure all dates of given month and year are present
+    _, n_days_in_month = monthrange(year, month)
+    expected_dates = [dt.date(year, month, i) for i in range(1, n_days_in_month + 1)]
+    parsed_dates = [row["date"] for row in rows]
+
+    if parsed_dates != expected_dates:
+        unexpected_dates = set(parsed_dates) - set(expected_dates)
+        unexpected_dates = [d.isoformat() for d in unexpected_dates]
+        msg = f"""{EZEIT_ERROR}. All dates of year {year} and month no. {month} have to be included.
+            The import seems to deviate in some way: wrong year/month or incomplete data?
+            Expected {n_days_in_month} dates, got {len(parsed_dates)}
+            In case any valid dates were imported, these are the unexpected ones: {unexpected_dates}"""
+        raise ValueError(msg)
+
+    return _to_models(rows)
+
+
+def parse_working_hours_range(file:BinaryIO, min_date:dt.date, max_date:dt.date) -> list[EZeitDay]:
+    """Bulk variant of parse_working_hours for an arbitrary date range, e.g. a full year.
+    The rows are split by month and each month is checked for completeness separately
+    (months cut by the range boundaries only need the dates inside the range).
+    All incomplete months are reported at once, so that a single upload can be fixed in one go."""
+
+    if min_date > max_date:
+        raise ValueError(f"{EZEIT_ERROR}. Start date {min_date} is after end date {max_date}.")
+
+    rows = _parse_rows(file)
+
+    # split parsed dates by month, collecting dates outside of the range separately
+    parsed_dates_by_month = defaultdict(list)
+    unexpected_dates = list()
+    for row in rows:
+        date = row["date"]
+        if min_date <= date <= max_date:
+            parsed_dates_by_month[(date.year, date.month)].append(date)
+        else:
+            unexpected_dates.append(date)
+
+    # check each month of the range on its own
+    errors = list()
+    for year, month in iter_months(min_date, max_date):
+        _, n_days_in_month = monthrange(year, month)
+        first_date = max(min_date, dt.date(year, month, 1))
+        last_date = min(max_date, dt.date(year, month, n_days_in_month))
+        expected_dates = [dt.date(year, month, i) for i in range(first_date.day, last_date.day + 1)]
+        parsed_dates = parsed_dates_by_month[(year, month)]
+        if parsed_dates != expected_dates:
+            missing_dates = sorted(set(expected_dates) - set(parsed_dates))
+            n_duplicates = len(parsed_dates) - len(set(parsed_dates))
+            errors.append(f"{year}-{month:02d}: expected {len(expected_dates)} dates, got {len(parsed_dates)} "
+                f"(missing: {[d.isoformat() for d in missing_dates]}, duplicates: {n_duplicates})")
+
+    if unexpected_dates:
+        errors.append(f"{len(unexpected_dates)} dates outside of the timespan "
+            f"(from {unexpected_dates[0].isoformat()} to {unexpected_dates[-1].isoformat()})")
+
+    if errors:
+        msg = f"""{EZEIT_ERROR}. All dates from {min_date} to {max_date} have to be included exactly once.
+            The import deviates in the following months: """ + "; ".join(errors)
+        raise ValueError(msg)
+
+    return _to_models(rows)
+
+
+def iter_months(min_date:dt.date, max_date:dt.date) -> Iterator[tuple[int, int]]:
+    """Yields (year, month) for every month touched by the date range"""
+    year, month = min_date.year, min_date.month
+    while (year, month) <= (max_date.year, max_date.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _parse_rows(file:BinaryIO) -> list[dict]:
+    """Reads and parses the csv rows, sorted by date"""
+
     # read csv
     rows = csv_dict_reader(file)
 
@@ -65,19 +143,10 @@ def parse_working_hours(file:BinaryIO, month:int, year:int) -> list[EZeitDay]:
     # sort rows by date
     rows.sort(key=lambda r: r["date"])
 
-    # ensure all dates of given month and year are present
-    _, n_days_in_month = monthrange(year, month)
-    expected_dates = [dt.date(year, month, i) for i in range(1, n_days_in_month + 1)]
-    parsed_dates = [row["date"] for row in rows]
+    return rows
 
-    if parsed_dates != expected_dates:
-        unexpected_dates = set(parsed_dates) - set(expected_dates)
-        unexpected_dates = [d.isoformat() for d in unexpected_dates]
-        msg = f"""{EZEIT_ERROR}. All dates of year {year} and month no. {month} have to be included.
-            The import seems to deviate in some way: wrong year/month or incomplete data?
-            Expected {n_days_in_month} dates, got {len(parsed_dates)}
-            In case any valid dates were imported, these are the unexpected ones: {unexpected_dates}"""
-        raise ValueError(msg)
+
+def _to_models(rows:list[dict]) -> list[EZeitDay]:
 
     # Rename columns, keep only required ones and turn each row into pydantic model
     _map_columns = lambda row: {
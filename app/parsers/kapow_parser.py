@@ -1,49 +1,66 @@
 from lxml import etree
-from typing import BinaryIO
+from typing import BinaryIO, Iterator
 from app.models import Event, EventSources
 import json
 from datetime import date
 
-PARSER = etree.XMLParser(encoding="utf-8")
-
 KAPOW_ERROR = "Import of kapow file failed"
 
-def parse_kapow_sessions(file:BinaryIO, min_date:date, max_date:date) -> list[Event]:
-    
-    # parse xml root
-    xml_tree = etree.parse(file, PARSER)
-    xml = xml_tree.getroot()
+# depth of elements in the kapow xml tree: <kapow><project name="..."><session .../></project></kapow>
+PROJECT_DEPTH = 2
+SESSION_DEPTH = 3
 
-    # parse kapow sessions as events in specified date range
-    _in_date_range = lambda x: x >= min_date and x <= max_date
-
-    events = list()
-    for project in xml.iterfind(f"./project"):
-        project_name = project.attrib["name"]
-        sessions = (dict(p.attrib, **{"categories": project_name}) for p in project)
-        sessions = [s for s in sessions if _in_date_range(date.fromisoformat(s["date"]))]
-        events.extend(sessions)
-
-    # transform event dictionaries into target pydantic models 
-    _transform_event = lambda e: {
-        "start": e["date"] + "T" + e["start"],
-        "end": e["date"] + "T" + e["stop"],
-        "categories": json.dumps([e["categories"]]),
-        "source": EventSources.KAPOW.value,
-        "additional_metadata": json.dumps({
-            "kapow_billed": int(e["billed"]),
-            "kapow_note": e["note"]
-        })
-    }
-    
-    events = (_transform_event(e) for e in events)
+def parse_kapow_sessions(file:BinaryIO, min_date:date, max_date:date) -> list[Event]:
+    """Parses kapow sessions in specified date range as events. 
+    See iter_kapow_sessions for a lazy alternative."""
+    return list(iter_kapow_sessions(file, min_date, max_date))
 
-    events = [Event.model_validate(e) for e in events]
 
-    return events
+def iter_kapow_sessions(file:BinaryIO, min_date:date, max_date:date) -> Iterator[Event]:
+    """Streams kapow sessions in specified date range as events.
+    Kapow files hold the entire punch clock history, so elements are cleared once processed
+    and sessions are filtered by their date before building anything,
+    which keeps memory bounded regardless of the file size.
+    Parsing errors are raised while iterating, including malformed dates of sessions outside the date range."""
 
+    # parse kapow sessions as events in specified date range
+    xml = etree.iterparse(file, events=("start", "end"), encoding="utf-8", remove_comments=True)
+    
+    depth = 0
+    project_name = None
+    for event, element in xml:
 
+        if event == "start":
+            depth += 1
+            if depth == PROJECT_DEPTH and element.tag == "project":
+                project_name = element.attrib["name"]
+            continue
 
+        if depth == SESSION_DEPTH and project_name is not None:
+            session = element.attrib
+            if min_date <= date.fromisoformat(session["date"]) <= max_date:
+                yield _transform_session(session, project_name)
+        elif depth == PROJECT_DEPTH:
+            project_name = None
+        
+        depth -= 1
 
+        # free memory of processed elements, including references kept by the parent element
+        if depth >= PROJECT_DEPTH - 1:
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
 
 
+def _transform_session(session:etree._Attrib, project_name:str) -> Event:
+    """Transforms kapow session attributes into target pydantic model"""
+    return Event.model_validate({
+        "start": session["date"] + "T" + session["start"],
+        "end": session["date"] + "T" + session["stop"],
+        "categories": json.dumps([project_name]),
+        "source": EventSources.KAPOW.value,
+        "additional_metadata": json.dumps({
+            "kapow_billed": int(session["billed"]),
+            "kapow_note": session["note"]
+        })
+    })
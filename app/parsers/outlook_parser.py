@@ -20,46 +20,84 @@ def parse_calendar_events(file:BinaryIO, min_date:dt.date, max_date:dt.date) ->
     columns_recieved = rows[0].keys()
     check_mandatory_columns(MANDATORY_COLUMNS, columns_recieved, OUTLOOK_ERROR)
 
+    # keep only events starting in specified date range, before doing any other work per row
+    # dates are parsed once per distinct date string, since many events share the same date
+    start_dates = dict()
+    rows_in_range = list()
+    for row in rows:
+        start_date = row["Beginnt am"]
+        if start_date not in start_dates:
+            start_dates[start_date] = _parse_date(start_date)
+        if min_date <= start_dates[start_date] <= max_date:
+            rows_in_range.append(row)
+
     # remove duplicated events: rare occurance due to synchronization issues
     # https://login.microsoftonline.com/common/reprocess?ctx=rQQIARAAfZO7a9x2AMdPPuf8IE1MKKVLS4ZASx3d_ST99HJxQda9dJZ09p3uIUMrJJ10lu6kn6zH6U5ToUugHUJb6GPsUshkQqElU5YuhkLmkLSZPZTSyWPtf6DLF77w_U7fz3d7g60yVVAFH5XJKth7YHLEhAemjZsmS-PQdjncIqCN05zlUpCjSc514nvbO39an736tvSB9Aj_-PUXP9x--AR7_zRNo2SvVjPDJHfipBp4dowS5KZVGwW13zDsBYZdYdiTtYShOAbQPMfxPEGwgOZgVa1PSSU4hnqgpyeaQnZFAJS6QMgjCaqklOpBA6r1-Vz1e3OdVHLdt0l1pC-V-jTtjgaFvgJALfRc1uaeqimpoumrbkuiFU1YKsV89nwNe7l2tytk6Sl5Iyj2CudybT1EofPv2paL4sCIUJL-WP653I2cUJqIKAwdO63epJ0w9Wwz9VB4FKPIiVPPSfaRn1JztcX2KHwkk4JiQPwwKobtIV0QNm4sF4cd3vSCTttIicFyzjR6OSXGcMXBbuYRWdCfRP0DizElQ9WH6AgfhQPPHoqJR58oc-fUXDJ2YXbigwOzzhUNwWhmrYXQPTg7pDrNjt7Q-Zmc-wIarHpBYyyBkFvJIYjZGXVdjM8Kf8YBfMqkvicySQzzhTwxpuSpO2GSoglWp8daKjJxn6Lw2ejEPEHGMCZsLVwM8dio9wSiaOFp3c3OFgKLdyJVRr02v9Jb49EAOgD1QjDLO02C5IM-TcrhwpISenHiTadRLIxbma1Bn7X8BRq63hFzBERzjHjDjcdNq0e0KbaZGaPmYSh2RUrMHcbMnfnAFlh9cKbiPMpafa9paVKDz7oTVvGm8UwcjXPNlfxpXB_LfGr7xdNy5RqsAIXPyg9Y1uEgpBmc4u0bbKGJ8wx0cJJhIW-xcMKR9kX5zvV2oTe5H8XI9ebOi3Xscv2dzY2dyrul-6UP3wblvc3N7Z3Sjbtax366dc3557_8IX_93afqN5-8fvPl-Veli1s1NNv1CrTws0wWJsIuDDsUAh3f4psoE7R8aa4m0cAa2BrK94k94nEFe1ypXFS2pLqhNjTIkv9UsEcbpWdb7_3vY17e3tq-xjMy72Hk87dKV3f--v3V-a_fP_27fXn3Yf9IL3ZTtZbZaYvv96k29BAPABq7wDuGGQo9rVvjuJVwnOyf72Bvdkr_AQ2&sessionid=77e84456-39c5-4c4a-964e-26749b74d82c&sso_nonce=AwABEgEAAAADAOz_BQD0_zTbT8eBRp00TwraZXqoBnOqUiC9Oqosch0xZ1QPiIfqeOe3pTEu_NtsAPDaSlAK0gdPTtOf0Ds9k4NIgGz5j8AgAA&client-request-id=dc5e62de-0094-4927-882d-3bdd83990c2c&mscrid=dc5e62de-0094-4927-882d-3bdd83990c2c)
-    # Deduplication approach: https://www.geeksforgeeks.org/python/python-removing-duplicate-dicts-in-list/
-    rows = list({json.dumps(row, sort_keys=True) for row in rows})
-    rows = [json.loads(row) for row in rows]
+    # Deduplication in a single pass on a tuple of all values, keeping the first occurance in input order.
+    # All rows share the same header, so the values are in the same column order for each row.
+    seen = set()
+    unique_rows = list()
+    for row in rows_in_range:
+        key = _row_key(row)
+        if key not in seen:
+            seen.add(key)
+            unique_rows.append(row)
     
-    # parse rows
-    for row in rows:
-        
-        # derive start timestamp
-        start = row["Beginnt am"] + "." + row["Beginnt um"]
-        row["start"] = dt.datetime.strptime(start, "%d.%m.%Y.%H:%M:%S")
-
-        # derive end timestamp
-        end = row["Endet am"] + "." + row["Endet um"]
-        row["end"] = dt.datetime.strptime(end, "%d.%m.%Y.%H:%M:%S")
+    # parse rows to events
+    events = list()
+    for row in unique_rows:
 
         # parse categories
         categories = row["Kategorien"]
         if categories == "" or categories is None:
             categories = "outlook_default"
-        row["categories"] = json.dumps(categories.split(";"))
 
-        # add column marking the data source
-        row["source"] = EventSources.OUTLOOK.value
-    
-        # add placeholder column for additional metadata
-        # This can be extended in future versions to hold arbitrary json data
-        row["additional_metadata"] = None
-
-    # sort by start timestamp
-    rows.sort(key=lambda r: r["start"])
+        events.append({
+            "start": _parse_datetime(start_dates, row["Beginnt am"], row["Beginnt um"]),
+            "end": _parse_datetime(start_dates, row["Endet am"], row["Endet um"]),
+            "categories": json.dumps(categories.split(";")),
+            # add column marking the data source
+            "source": EventSources.OUTLOOK.value,
+            # add placeholder column for additional metadata
+            # This can be extended in future versions to hold arbitrary json data
+            "additional_metadata": None
+        })
 
-    # keep only events starting in specified date range
-    _in_date_range = lambda x: min_date <= x.date() <= max_date
-    rows = [row for row in rows if _in_date_range(row["start"])]
+    # sort by start timestamp, stable for events starting at the same time
+    events.sort(key=lambda e: e["start"])
 
     # turn each row into pydantic model
-    rows = [Event.model_validate(row) for row in rows]
+    events = [Event.model_validate(e) for e in events]
+
+    return events
 
-    print(rows)
 
-    return rows
\ No newline at end of file
+def _row_key(row:dict) -> tuple:
+    """Hashable key of all values of a row. Surplus values of rows longer than the header
+    are collected by csv.DictReader as a list, which has to be turned into a tuple"""
+    return tuple(tuple(v) if isinstance(v, list) else v for v in row.values())
+
+
+def _parse_date(value:str) -> dt.date:
+    """Parses dates formatted as %d.%m.%Y. Slicing the fixed width format is much faster than strptime.
+    Other representations strptime accepts, e.g. without leading zeros, are passed on to it."""
+    if len(value) == 10 and value[2] == "." and value[5] == "." \
+        and value[:2].isdigit() and value[3:5].isdigit() and value[6:].isdigit():
+        return dt.date(int(value[6:]), int(value[3:5]), int(value[:2]))
+    return dt.datetime.strptime(value, "%d.%m.%Y").date()
+
+
+def _parse_datetime(dates:dict[str, dt.date], date:str, time:str) -> dt.datetime:
+    """Combines date formatted as %d.%m.%Y and time formatted as %H:%M:%S to a datetime.
+    Parsed dates are memoized in given dictionary."""
+
+    if date not in dates:
+        dates[date] = _parse_date(date)
+    day = dates[date]
+
+    if len(time) == 8 and time[2] == ":" and time[5] == ":" \
+        and time[:2].isdigit() and time[3:5].isdigit() and time[6:].isdigit():
+        return dt.datetime(day.year, day.month, day.day, int(time[:2]), int(time[3:5]), int(time[6:]))
+    
+    time = dt.datetime.strptime(time, "%H:%M:%S").time()
+    return dt.datetime.combine(day, time)
@@ -0,0 +1,70 @@
+import io
+import threading
+from datetime import date
+from typing import Any, Literal
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from lxml import etree
+from pydantic import ValidationError
+
+from app.models import EZeitDay, Event
+from app.parsers.ezeit_parser import parse_working_hours, parse_working_hours_range, EZEIT_ERROR
+from app.parsers.outlook_parser import parse_calendar_events, OUTLOOK_ERROR
+from app.parsers.kapow_parser import parse_kapow_sessions, KAPOW_ERROR
+
+# ---------------------------------------------------------------------------------------
+# Parser jobs that can be dispatched to a thread or process pool.
+#   - jobs take the file content as bytes, since file handles can not be passed to other processes
+#   - expected parsing errors are returned as error details instead of being raised,
+#     as not all exception types (e.g. pydantic's ValidationError) survive pickling
+#   - this module deliberately avoids importing the configuration or database,
+#     since worker processes import it on startup
+# ---------------------------------------------------------------------------------------
+
+N_WORKERS = 3 # one per import file
+
+_executors: dict[str, Executor] = dict()
+_executors_lock = threading.Lock()
+
+
+def get_executor(kind:Literal["thread", "process"]) -> Executor:
+    """Returns a pool of given kind, created on first use and shared afterwards.
+    Process pools can use multiple cores for the CPU heavy parsing and validation."""
+    with _executors_lock:
+        if kind not in _executors:
+            pool = ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor
+            _executors[kind] = pool(max_workers=N_WORKERS)
+        return _executors[kind]
+
+
+def _error_detail(exc:Exception) -> Any:
+    return exc.errors() if isinstance(exc, ValidationError) else str(exc)
+
+
+def parse_ezeit(content:bytes, month:int, year:int) -> tuple[list[EZeitDay] | None, Any]:
+    try:
+        return parse_working_hours(io.BytesIO(content), month=month, year=year), None
+    except (ValueError, KeyError, ValidationError) as exc:
+        return None, _error_detail(exc)
+
+
+def parse_ezeit_range(content:bytes, min_date:date, max_date:date) -> tuple[list[EZeitDay] | None, Any]:
+    try:
+        return parse_working_hours_range(io.BytesIO(content), min_date, max_date), None
+    except (ValueError, KeyError, ValidationError) as exc:
+        return None, _error_detail(exc)
+
+
+def parse_outlook(content:bytes, min_date:date, max_date:date) -> tuple[list[Event] | None, Any]:
+    try:
+        return parse_calendar_events(io.BytesIO(content), min_date, max_date), None
+    except (ValueError, ValidationError) as exc:
+        return None, _error_detail(exc)
+
+
+def parse_kapow(content:bytes, min_date:date, max_date:date) -> tuple[list[Event] | None, Any]:
+    try:
+        return parse_kapow_sessions(io.BytesIO(content), min_date, max_date), None
+    except ValidationError as exc:
+        return None, exc.errors()
+    except etree.XMLSyntaxError as exc:
+        return None, f"{KAPOW_ERROR}. A parsing error occured: " + str(exc)
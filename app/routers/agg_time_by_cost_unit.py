@@ -1,22 +1,74 @@
 
-from fastapi import APIRouter, HTTPException, status
-import json
+from fastapi import APIRouter, HTTPException, Request, Response, status
 from datetime import date
+import asyncio
 
-from app.models import EventSources, Event
+from app.models import EventSources, EventCategory, EZeitDay, DayCategories as EZC
+import app.interval_engine as intervals
+import app.database.db as db
 import app.database.sqlite_operations as sql_ops
-from app.config import parse_config, get_root_path
+import app.database.async_db as adb
+import app.database.data_versions as data_versions
+from app.database.result_cache import ResultCache
+from app.database.query_builder import AggTimeByCostUnitQuery
+from app.config import current_config, pinned_config, config_service, get_root_path, ConfigSnapshot
+from app.etags import make_etag, is_not_modified, not_modified, set_etag
 
 router = APIRouter(prefix="/api")
 
-# unpack important constants from config
-CONFIG = parse_config()
+# results are keyed by date range, configuration and the version of stored data in that range,
+# so entries of outdated versions are never hit again and simply age out of the cache
+AGG_CACHE = ResultCache(max_entries=128, max_rows=100_000)
+
+# ambigous mappings are checked across all events, hence keyed by the global data version
+AMBIGUITY_CACHE = ResultCache(max_entries=1)
+
+
+def _invalidate_caches(old:ConfigSnapshot, new:ConfigSnapshot) -> None:
+    """Results computed with the previous cost units are not needed anymore once the configuration was reloaded"""
+    if new.aggregation_hash != old.aggregation_hash:
+        AGG_CACHE.invalidate()
+        AMBIGUITY_CACHE.invalidate()
+
+config_service().subscribe(_invalidate_caches)
 
 # get root for resources
 root_path = get_root_path()
 
+# aggregation sql, built from its template once at startup
+AGG_QUERY = AggTimeByCostUnitQuery(root_path / "app/routers/agg_time_by_cost_unit.sql")
+
 @router.get(f"/agg_time_by_cost_unit") 
-def agg_time_by_cost_unit(from_date:date, to_date:date) -> list[dict]:
+async def get_agg_time_by_cost_unit(request:Request, response:Response, from_date:date, to_date:date) -> list[dict]:
+
+    # answer revalidations without aggregating, if neither stored data nor the aggregation settings changed
+    etag = aggregation_etag(request, from_date, to_date)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    def aggregate() -> list[dict]:
+        with pinned_config() as config:
+            return agg_time_by_cost_unit(config, from_date, to_date)
+
+    result = await adb.run(aggregate)
+    set_etag(response, etag)
+    return result
+
+
+def aggregation_etag(request:Request, from_date:date, to_date:date) -> str:
+    """ETag of responses built from the aggregation of given date range.
+    Besides the data in that range, it depends on the global data version, as ambigous mappings
+    are checked across all events: an import into any other month may turn the response into an error and back."""
+    return make_etag(request, data_versions.version_of(from_date, to_date), data_versions.global_version(),
+        current_config().aggregation_hash)
+
+
+def agg_time_by_cost_unit(config:ConfigSnapshot, from_date:date, to_date:date) -> list[dict]:
+    """Aggregates time spent by cost units per date. Also used by the frontend to build reports.
+    Blocking, to be run on the read executor of async_db. Reports aggregate, build and render
+    their tables within one such call, see routers/frontend.py.
+    Expects the configuration to be pinned by the caller, see config.pinned_config,
+    so that the cost unit tables are not rebuilt for a reloaded configuration while they are queried."""
 
     # check for invalid date entry
     if from_date > to_date:
@@ -25,7 +77,11 @@ def agg_time_by_cost_unit(from_date:date, to_date:date) -> list[dict]:
             detail="Parameter 'from_date' has to predate parameter 'to_date'")
 
     # check for ambigous mappings of events to cost_units
-    ambigous_mappings = _get_ambigous_event_mappings()
+    ambiguity_key = (data_versions.global_version(), config.cost_units_hash)
+    ambigous_mappings = AMBIGUITY_CACHE.get(ambiguity_key)
+    if ambigous_mappings is None:
+        ambigous_mappings = _get_ambigous_event_mappings(config)
+        AMBIGUITY_CACHE.put(ambiguity_key, ambigous_mappings)
     if len(ambigous_mappings) > 0:
         msg = "Found work events with redundant or ambigous mappings to cost units." \
             + " Please correct the entries in question and reimport the data." \
@@ -38,42 +94,32 @@ def agg_time_by_cost_unit(from_date:date, to_date:date) -> list[dict]:
             }
         )
 
-    # read corresponding sql template
-    template_filepath = root_path / "app/routers/agg_time_by_cost_unit.sql"
-    with open(template_filepath,  "r", encoding="utf-8") as f:
-        sql_template = f.read()
-
-    # insert dynamic sql statements based on cost units in configuration
-    sql_pivot_statements = list()
-    sql_sum_columns = list()
-
-    for cost_unit in CONFIG.cost_units.keys():
-        
-        sql_pivot_statements.append(f"MAX(CASE WHEN cost_unit = '{cost_unit}' THEN event_time_in_cost_unit ELSE 0 END) AS '{cost_unit}'")
-        
-        sql_sum_columns.append(f"e.{cost_unit}")
-
-    sql_pivot_statements = ", ".join(sql_pivot_statements)        
-    sql_sum_columns = " + ".join(sql_sum_columns)
-
-    sql_template = sql_template.format(
-        sql_pivot_statements = sql_pivot_statements,
-        sql_sum_columns = sql_sum_columns
-    )
-
-    print(sql_template)
-
-    # map query parameters to names in sql template
-    # table names have to be part of the sql template, 
-    # see https://stackoverflow.com/questions/78516750/parametrize-table-name-in-sql-query
-    params = {
-        "cost_units": json.dumps(CONFIG.model_dump()["cost_units"]),
-        "from_date": from_date.isoformat(),
-        "to_date": to_date.isoformat()
-    }
-    
-    result = sql_ops.fetch_all_as_dicts(sql_template, params)
+    # serve cached result if stored data in given date range did not change since it was cached
+    cache_key = (from_date, to_date, config.aggregation_hash, data_versions.version_of(from_date, to_date))
+    result = AGG_CACHE.get(cache_key)
+
+    if result is None and config.config.event_overlaps.policy != "count_all":
+
+        # overlapping events are resolved by the interval engine instead of counting each of them
+        result = _agg_with_interval_engine(config, from_date, to_date)
+        AGG_CACHE.put(cache_key, result)
+
+    if result is None:
+
+        # sql is only rebuilt from its template when the configured cost units change
+        sql = AGG_QUERY.sql(config.pivot_columns)
+
+        # map query parameters to names in sql template
+        # table names have to be part of the sql template, 
+        # see https://stackoverflow.com/questions/78516750/parametrize-table-name-in-sql-query
+        params = {
+            "from_date": from_date.isoformat(),
+            "to_date": to_date.isoformat()
+        }
     
+        result = sql_ops.fetch_all_as_dicts(sql, params)
+        AGG_CACHE.put(cache_key, result)
+
     faulty_bookings = [r for r in result if r["event_minutes_exceed_booked_minutes"] == 1]
     if len(faulty_bookings) != 0:
         detail = {"error": "Event time exceeds booked time on followin dates", "data":  faulty_bookings}
@@ -82,7 +128,72 @@ def agg_time_by_cost_unit(from_date:date, to_date:date) -> list[dict]:
     return result
 
 
-def _get_ambigous_event_mappings() -> list[tuple]:
+def _agg_with_interval_engine(config:ConfigSnapshot, from_date:date, to_date:date) -> list[dict]:
+    """Same rows as the aggregation sql, but with event minutes computed from the events themselves
+    by the interval engine according to the configured overlap policy"""
+
+    settings = config.config.event_overlaps
+    events = db.get_event_intervals(from_date, to_date)
+    minutes, _ = intervals.minutes_by_cost_unit(events, settings.policy, [s.value for s in settings.source_priority])
+
+    sql = f"""SELECT date, day_category, booked_minutes FROM {EZeitDay.table_name}
+        WHERE date BETWEEN :from_date AND :to_date ORDER BY date;"""
+    days = sql_ops.fetch_all_as_dicts(sql, {"from_date": from_date.isoformat(), "to_date": to_date.isoformat()})
+
+    # pivot cost units into columns and derive totals, as in agg_time_by_cost_unit.sql
+    result = list()
+    for day in days:
+        on_work = day["day_category"] == EZC.ON_WORK.value
+        day_minutes = minutes.get(day["date"], dict())
+        row = {
+            "date": day["date"],
+            "day_category": day["day_category"],
+            "booked_minutes": day["booked_minutes"] if on_work else 0
+        }
+        for cost_unit in config.pivot_columns:
+            row[cost_unit] = day_minutes.get(cost_unit, 0) if on_work else 0
+        row["event_minutes"] = sum(row[cost_unit] for cost_unit in config.pivot_columns)
+        row["event_minutes_exceed_booked_minutes"] = int(row["booked_minutes"] < row["event_minutes"])
+        row["non_event_minutes"] = row["booked_minutes"] - row["event_minutes"]
+        row["default_cost_unit_inkl_non_event_minutes"] = row["default_cost_unit"] + row["non_event_minutes"]
+        result.append(row)
+
+    return result
+
+
+@router.get("/agg_time_by_cost_unit/overlaps")
+async def get_event_overlaps(from_date:date, to_date:date) -> dict:
+    """Lists spans of time covered by more than one event, along with the configured overlap policy
+    deciding whether such time is counted once or for each event, see interval_engine"""
+
+    settings = current_config().config.event_overlaps
+    events = await adb.run(db.get_event_intervals, from_date, to_date)
+    _, overlaps = await asyncio.to_thread(intervals.minutes_by_cost_unit,
+        events, settings.policy, [s.value for s in settings.source_priority])
+
+    return {"policy": settings.policy, "overlaps": overlaps}
+
+
+@router.get("/agg_time_by_cost_unit/cache")
+async def get_agg_cache_stats() -> dict:
+    return {"results": AGG_CACHE.stats(), "ambigous_mappings": AMBIGUITY_CACHE.stats()}
+
+
+@router.delete("/agg_time_by_cost_unit/cache")
+async def invalidate_agg_cache(from_date:date | None = None, to_date:date | None = None) -> dict:
+    """Removes cached results overlapping given date range, or all cached results if no range is given"""
+
+    if from_date is None and to_date is None:
+        AMBIGUITY_CACHE.invalidate()
+        return {"invalidated": AGG_CACHE.invalidate()}
+    
+    from_date = from_date or date.min
+    to_date = to_date or date.max
+    n_invalidated = AGG_CACHE.invalidate(lambda key: key[0] <= to_date and key[1] >= from_date)
+    return {"invalidated": n_invalidated}
+
+
+def _get_ambigous_event_mappings(config:ConfigSnapshot) -> list[tuple]:
     """For each event source, find events with categories assigned to multiple cost_units.
     Events of any given source, e.g. outlook, can be stored with multiple categories assigned.
     This allows for flexibility as to how users can work with categories in respective programs.
@@ -93,17 +204,17 @@ def _get_ambigous_event_mappings() -> list[tuple]:
 
     for source in EventSources:
         source = source.value    
-        mapped_categories = CONFIG.mapped_categories_of_event_source(source)
+        mapped_categories = config.cost_unit_by_category[source].keys()
         mapped_categories = ",".join(f"'{c}'" for c in mapped_categories) 
         sql = f"""
             SELECT 
-                e.id, e.source, 
-                COUNT(array.value) AS n_mapped_categories,
-                GROUP_CONCAT(array.value, ' | ') AS invalid_category_combination
-            FROM {Event.table_name} e, json_each(e.categories) array
-            WHERE e.source = '{source}'
-            AND array.value IN ({mapped_categories})
-            GROUP BY e.id
+                c.event_id AS id, c.source, 
+                COUNT(c.category) AS n_mapped_categories,
+                GROUP_CONCAT(c.category, ' | ') AS invalid_category_combination
+            FROM {EventCategory.table_name} c
+            WHERE c.source = '{source}'
+            AND c.category IN ({mapped_categories})
+            GROUP BY c.event_id
             HAVING n_mapped_categories > 1
             ;"""
         params = dict()
@@ -1,40 +1,13 @@
 WITH
 
-cost_unit_map AS (
-    -- parse cost_unit mapping to categories from json to sql table
-    SELECT
-        top.key AS cost_unit,
-        level_1.key AS source,
-        level_2.value AS category
-    FROM
-        json_each(:cost_units) top,
-        json_each(top.value) level_1,
-        json_each(level_1.value) level_2
-    WHERE level_1.key != 'label'  
-),
-
-mapped_events AS (
-    -- map event categories to cost unit according to cost unit map
-    SELECT
-        e.*, array.value AS mapped_category, m.cost_unit,
-        ((unixepoch(e.end) - unixepoch(e.start)) / 60) AS event_duration_minutes,
-        DATE(start) as date
-    FROM
-        events e,
-        json_each(e.categories) AS array
-    JOIN cost_unit_map as m
-        ON e.source = m.source AND array.value = m.category
-    WHERE DATE(e.start) BETWEEN :from_date AND :to_date
-),
-
 mapped_events_aggregated AS (
-    -- agg_time_by_cost_unit event times by date and cost unit
+    -- event times by date and cost unit, materialized when storing events
     SELECT
-        DATE(start) as date,
+        date,
         cost_unit,
-        SUM((unixepoch(end) - unixepoch(start)) / 60) AS event_time_in_cost_unit
-    FROM mapped_events
-    GROUP BY date, cost_unit
+        minutes AS event_time_in_cost_unit
+    FROM daily_cost_unit_minutes
+    WHERE date BETWEEN :from_date AND :to_date
 ),
 
 ezeit_with_aggregated_events AS (
@@ -0,0 +1,105 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Literal
+from datetime import date
+import csv
+import io
+import json
+
+import app.models as mo
+from app.models import EventSources as IMS
+import app.database.async_db as adb
+from app.database.pydantic_to_sqlite import table_columns
+from app.routers.rest import add_date_range
+
+router = APIRouter(prefix="/api/export")
+
+# ---------------------------------------------------------------------------------------
+# Streaming bulk exports
+#   - rows are fetched from a sqlite cursor in batches and written to the response batch by batch,
+#     so memory stays constant and the first rows are sent while later ones are still read
+#   - columns holding json (e.g. event categories) are written as stored, without decoding them
+# ---------------------------------------------------------------------------------------
+
+BATCH_SIZE = 1000
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@router.get(f"/{mo.EZeitDay.table_name}")
+async def export_ezeit(format:Literal["ndjson", "csv"] = "ndjson",
+    from_date:date | None = None, to_date:date | None = None) -> StreamingResponse:
+
+    conditions, params = list(), dict()
+    add_date_range(conditions, params, mo.EZeitDay.date_column, from_date, to_date)
+
+    return _export(mo.EZeitDay, "date", conditions, params, format)
+
+
+@router.get(f"/{mo.Event.table_name}")
+async def export_events(format:Literal["ndjson", "csv"] = "ndjson",
+    from_date:date | None = None, to_date:date | None = None,
+    source:Literal[IMS.KAPOW, IMS.OUTLOOK] | None = None) -> StreamingResponse:
+
+    conditions, params = list(), dict()
+    if source:
+        conditions.append("source = :source")
+        params["source"] = source
+    add_date_range(conditions, params, mo.Event.date_column, from_date, to_date)
+
+    return _export(mo.Event, "start", conditions, params, format, json_columns={"categories", "additional_metadata"})
+
+
+def _export(model:mo.CoreDataModel, sort_key:str, conditions:list[str], params:dict,
+    format:Literal["ndjson", "csv"], json_columns:set[str] = set()) -> StreamingResponse:
+    """Streams all rows of the model's table matching the conditions, sorted by (sort_key, id)"""
+
+    columns = list(table_columns(model))
+    sql = f"SELECT {', '.join(columns)} FROM {model.table_name}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {sort_key}, id;"
+
+    batches = adb.iter_batches(sql, params, BATCH_SIZE)
+    if format == "csv":
+        content = _iter_csv(batches, columns)
+    else:
+        content = _iter_ndjson(batches, columns, json_columns)
+
+    filename = f"{model.table_name}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(content, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+async def _iter_ndjson(batches:AsyncIterator[list[tuple]], columns:list[str], json_columns:set[str]) -> AsyncIterator[str]:
+    """One json object per line. Values of json columns are inserted as they are stored"""
+
+    # keys are encoded once, values of regular columns are encoded per row
+    keys = [json.dumps(c) + ":" for c in columns]
+    is_json = [c in json_columns for c in columns]
+
+    async for batch in batches:
+        lines = list()
+        for row in batch:
+            fields = [
+                k + (v if j and v is not None else json.dumps(v))
+                for k, v, j in zip(keys, row, is_json)
+            ]
+            lines.append("{" + ",".join(fields) + "}\n")
+        yield "".join(lines)
+
+
+async def _iter_csv(batches:AsyncIterator[list[tuple]], columns:list[str]) -> AsyncIterator[str]:
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # header is sent right away, before the first batch is read
+    writer.writerow(columns)
+    yield buffer.getvalue()
+
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
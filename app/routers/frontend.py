@@ -1,94 +1,112 @@
 from fastapi import APIRouter, Request
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse 
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse 
 from datetime import date
-import random
 from calendar import monthrange
-from app.config import parse_config, get_root_path
-from app.routers.agg_time_by_cost_unit import agg_time_by_cost_unit
+from app.config import pinned_config, get_root_path
+from app.routers.agg_time_by_cost_unit import agg_time_by_cost_unit, aggregation_etag
 import app.database.db as db
-from app.models import EZeitDay, Event, EventSources as EVS
+import app.database.async_db as adb
+from app.etags import is_not_modified, not_modified, set_etag
+import app.sap_report as reports
+from app.models import CoreDataModel, EZeitDay, Event, EventSources as EVS
 from uuid import UUID
-from decimal import Decimal, ROUND_FLOOR
-
-CONFIG = parse_config()
+from typing import Literal
 
 router = APIRouter()
 
+# sources shown in the import preview: model, event source and label
+PREVIEW_SOURCES = {
+    "ezeit": (EZeitDay, None, "EZeit"),
+    EVS.OUTLOOK.value: (Event, EVS.OUTLOOK, "Outlook"),
+    EVS.KAPOW.value: (Event, EVS.KAPOW, "Kapow")
+}
+PREVIEW_SAMPLE_SIZE = 3
+PREVIEW_PAGE_SIZE = 100
+
 root_path = get_root_path()
 router.mount("/static", StaticFiles(directory=(root_path / "static")), name="static")
 router.mount("/javascript", StaticFiles(directory=(root_path / "javascript")), name="javascript")
 templates = Jinja2Templates(directory = (root_path / "templates"))
 
+# ---------------------------------------------------------------------------------------
+# Rendering
+#   - rendering templates and building report tables is cpu bound. Pages with tables are therefore
+#     not rendered on the event loop, where they would hold up every other request
+#   - reports aggregate, build and render their tables in a single call on the read executor of async_db,
+#     instead of passing through the event loop between these steps and queueing again for each of them
+#   - the other pages only render their templates on the read executor, see _render
+#   - reports pin the configuration while aggregating, see config.pinned_config,
+#     and label their tables from the same snapshot the aggregated cost units were pivoted with
+# ---------------------------------------------------------------------------------------
+
+
+async def _render(name:str, context:dict) -> HTMLResponse:
+    return await adb.run(templates.TemplateResponse, name, context=context)
+
 
 @router.get("/", response_class=HTMLResponse)
-def home(request: Request):
+async def home(request: Request):
     return templates.TemplateResponse("home.html", context={"request": request})
 
 
 @router.get("/not_implemented", response_class=HTMLResponse)
-def not_implemented(request: Request):
+async def not_implemented(request: Request):
     return templates.TemplateResponse("not_implemented.html", context={"request": request})
 
 
 @router.get("/import_files", response_class=HTMLResponse)
-def import_files(request: Request):
+async def import_files(request: Request):
     return templates.TemplateResponse("import_files.html", context={"request": request})
 
 
+@router.get("/import_files/bulk", response_class=HTMLResponse)
+async def import_files_bulk(request: Request):
+    return templates.TemplateResponse("import_files_bulk.html", context={"request": request})
+
+
 @router.get("/sap", response_class=HTMLResponse)
-def sap(request: Request):
+async def sap(request: Request):
     return templates.TemplateResponse("sap_form.html", context={"request": request})
 
 
 @router.get("/import_files/preview/{cache_id}", response_class=HTMLResponse)
-def import_file_preview(request:Request, cache_id:UUID, min_date:date, max_date:date):
-
-    # retrieve data 
-    ezeit_table = db.get_data_from_cache(EZeitDay, cache_id)
-    if len(ezeit_table) == 0:
-        return HTMLResponse(f"No ezeit data found for cache_id {cache_id}.", status_code=404)
-
-    outlook_table = db.get_data_from_cache(Event, cache_id, source=EVS.OUTLOOK)
-    if len(outlook_table) == 0:
-        return HTMLResponse(f"No outlook data found for cache_id {cache_id}.", status_code=404)
+async def import_file_preview(request:Request, cache_id:UUID, min_date:date, max_date:date):
 
-    kapow_table = db.get_data_from_cache(Event, cache_id, source=EVS.KAPOW) # optional, table may be empty
+    # counts and samples are computed in sql, all rows are loaded page by page when a table is expanded.
+    # the staging store is only attached to the writer connection, hence write=True
+    table_views = list()
+    for source, (model, event_source, label) in PREVIEW_SOURCES.items():
 
-    # create table views to insert into html templates
-
-    table_views = [
-        {"rows": ezeit_table, "source": "ezeit", "label": "EZeit"},
-        {"rows": outlook_table, "source": EVS.OUTLOOK, "label": "Outlook"},
-        {"rows": kapow_table, "source": EVS.KAPOW, "label": "Kapow"}
-    ]
-    
-    for view in table_views:
-
-        # reference rows for abbreviation
-        rows = view["rows"]
-
-        # remove id column as it is not needed for presentation
-        for row in rows: row.pop('id') 
-
-        # add row count
-        view["row_count"] = len(rows)
+        row_count = await adb.run(db.count_cached, model, cache_id, source=event_source, write=True)
+        if row_count == 0 and source != EVS.KAPOW: # kapow is optional, table may be empty
+            return HTMLResponse(f"No {source} data found for cache_id {cache_id}.", status_code=404)
 
         # Get sample rows for a shortened table view on top of collapsed tables containing all rows
-        if len(rows) <= 3:
-            samples = rows
-        else:
-            samples = random.sample(rows, 3)
-        view["samples"] = samples
-
+        columns = _preview_columns(model)
+        samples = await adb.run(db.sample_from_cache, model, cache_id, PREVIEW_SAMPLE_SIZE, columns, source=event_source, write=True)
+
+        table_views.append({
+            "source": source, "label": label,
+            "columns": columns, "row_count": row_count, "samples": samples,
+            "rows_url": f"/import_files/preview/{cache_id}/rows?source={source}"
+        })
+
+    # progress per month is only shown for bulk imports spanning multiple months.
+    # like in routers/import_files.py, the parsers are imported on first use instead of on startup
+    from app.parsers.ezeit_parser import iter_months
+    months = list(iter_months(min_date, max_date))
+    month_views = list()
+    if len(months) > 1:
+        month_views = await _get_month_views(cache_id, months, min_date, max_date)
  
-    return templates.TemplateResponse(
+    return await _render(
         "import_preview.html",
         context={
             "request": request,
             "table_views": table_views,
+            "month_views": month_views,
             "min_date": min_date,
             "max_date": max_date,
             "cache_id": cache_id
@@ -96,11 +114,61 @@ def import_file_preview(request:Request, cache_id:UUID, min_date:date, max_date:
     )
 
 
+@router.get("/import_files/preview/{cache_id}/rows", response_class=HTMLResponse)
+async def import_file_preview_rows(request:Request, cache_id:UUID, source:Literal["ezeit", "outlook", "kapow"], after:int | None = None):
+    """Returns a page of cached rows as html table rows, followed by a row loading the next page if there is one"""
+
+    model, event_source, _ = PREVIEW_SOURCES[source]
+    columns = _preview_columns(model)
+    rows = await adb.run(db.page_from_cache, model, cache_id, columns, PREVIEW_PAGE_SIZE, 
+        after_rowid=after, source=event_source, write=True)
+
+    next_url = None
+    if len(rows) == PREVIEW_PAGE_SIZE:
+        next_url = f"/import_files/preview/{cache_id}/rows?source={source}&after={rows[-1]['rowid']}"
+
+    return await _render(
+        "_import_preview_rows.html",
+        context={"request": request, "rows": rows, "columns": columns, "next_url": next_url}
+    )
+
+
+def _preview_columns(model:CoreDataModel) -> list[str]:
+    # id column is not needed for presentation
+    return [c for c in model.model_fields if c != "id"]
+
+
+async def _get_month_views(cache_id:UUID, months:list[tuple[int, int]], min_date:date, max_date:date) -> list[dict]:
+    """Counts cached rows per month and compares the EZeit dates to the days expected in that month"""
+
+    ezeit_counts = await adb.run(db.count_cached_by_month, EZeitDay, cache_id, write=True)
+    outlook_counts = await adb.run(db.count_cached_by_month, Event, cache_id, source=EVS.OUTLOOK, write=True)
+    kapow_counts = await adb.run(db.count_cached_by_month, Event, cache_id, source=EVS.KAPOW, write=True)
+
+    month_views = list()
+    for year, month in months:
+        key = f"{year}-{month:02d}"
+        _, n_days_in_month = monthrange(year, month)
+        first_date = max(min_date, date(year, month, 1))
+        last_date = min(max_date, date(year, month, n_days_in_month))
+        expected_days = (last_date - first_date).days + 1
+        ezeit_days = ezeit_counts.get(key, 0)
+        month_views.append({
+            "month": key,
+            "ezeit_days": f"{ezeit_days}/{expected_days}",
+            "outlook_events": outlook_counts.get(key, 0),
+            "kapow_events": kapow_counts.get(key, 0),
+            "complete": ezeit_days == expected_days
+        })
+
+    return month_views
+
+
 @router.get("/import_files/confirmed", response_class=HTMLResponse)
-def import_file_confirmed(request:Request, cache_id:UUID, min_date:date, max_date:date):
+async def import_file_confirmed(request:Request, cache_id:UUID, min_date:date, max_date:date):
 
-    ezeit_rows = db.store_data(EZeitDay, cache_id, min_date, max_date)
-    event_rows = db.store_data(Event, cache_id, min_date, max_date)
+    # both models are stored in one transaction, so that an import is never stored partially
+    ezeit_rows, event_rows = await adb.run(db.store_data_many, [EZeitDay, Event], cache_id, min_date, max_date, write=True)
 
     ezeit_msg = f"Number of imported dates from EZeit: {ezeit_rows}"
     event_msg = f"Number of imported events from all event sources: {event_rows}"
@@ -115,10 +183,10 @@ def import_file_confirmed(request:Request, cache_id:UUID, min_date:date, max_dat
 
 
 @router.get("/import_files/rejected", response_class=HTMLResponse)
-def import_file_rejected(request:Request, cache_id:UUID, min_date:date, max_date:date):
+async def import_file_rejected(request:Request, cache_id:UUID, min_date:date, max_date:date):
     
-    db.delete_cache(EZeitDay, cache_id)
-    db.delete_cache(Event, cache_id)
+    await adb.run(db.delete_cache, EZeitDay, cache_id, write=True)
+    await adb.run(db.delete_cache, Event, cache_id, write=True)
 
     msg = f"Cache with id {cache_id} was deleted."
     
@@ -132,27 +200,14 @@ def import_file_rejected(request:Request, cache_id:UUID, min_date:date, max_date
 
 
 @router.get("/sap/monthly_report", response_class=HTMLResponse)
-def sap_report(
+async def sap_report(
     request: Request, month:int, year:int, 
     decimal_hours:bool | None = None, decimal_comma:bool | None = None):
     
     """        
     Aggregates time spent by cost_units for given month and year.
     Segments data into calendar weeks to construct corresponding tables
-    in the html template returned.
-    The data structure expected by the template:
-        [
-            {
-                "title": "Tabelle KW 1",
-                "dates": ["2025-06-01", "2025-06-02", "2025-06-03"],
-                "rows": [
-                    {"name": "a", "highlighted": false, "values": [7.5, 2.0, 0.0]},
-                    {"name": "b", "highlighted": true, "values": [0.0, 8.0, 1.25]},
-                    ...
-                ]
-            },
-            ...
-        ]
+    in the html template returned, see reports.build_tables for the data structure.
     """
 
     # find first and last date of specified month
@@ -160,97 +215,129 @@ def sap_report(
     n_days_in_month = result[1]
     from_date, to_date = date(year, month, 1), date(year, month, n_days_in_month)
 
-    # get data
-    data = agg_time_by_cost_unit(from_date, to_date)
-
-    # flag if data is empty to adjust html output
-    empty_data = True if len(data) == 0 else False
-
-
-    # calculate decimal hours, always rounding off to 2 decimal places
-    if decimal_hours == True:
-        for row in data:
-            for k, v in row.items():
-                if isinstance(v, int):
-                    number = Decimal(v / 60)
-                    number = number.quantize(Decimal('0.01'), rounding=ROUND_FLOOR)
-                    if decimal_comma == True:
-                        number = str(number).replace(".", ",")
-                    row[k] = number
-
-    # add calendar week for each date
-    for d in data:
-        d["calendar_week"] = date.fromisoformat(d["date"]).isocalendar().week
-
-    # extract unique calendar weeks 
-    calendar_weeks = sorted(list(set(d["calendar_week"] for d in data)))
-
-    # extract cost_units from configuration to adjust order and labels of rows
-    cost_units = CONFIG.model_dump()["cost_units"]
-
-    # segregate default and user defined cost units for table layout costomization
-    cost_units_default = ["default_cost_unit", "overhead"]
-    cost_units_user_defined = [k for k in cost_units.keys() if k not in cost_units_default]
-
-    # define rows to be highlighted
-    highlighted_rows = set()
-    highlighted_rows.add("default_cost_unit_inkl_non_event_minutes")
-    highlighted_rows.update(cost_units_user_defined)
-     
-    # set row order
-    row_keys = \
-        ["day_category", "default_cost_unit_inkl_non_event_minutes"] + \
-        cost_units_user_defined + \
-        cost_units_default + \
-        ["booked_minutes", "event_minutes", "non_event_minutes"]
-
-    # set row labels
-    row_labels = {k: v["label"] for k,v in cost_units.items()}
-    default_cost_unit_label = cost_units["default_cost_unit"]["label"]
-    row_labels.update({
-        "default_cost_unit_inkl_non_event_minutes": \
-            default_cost_unit_label + \
-            " (incl. non-event minutes)",
-        "default_cost_unit": \
-            default_cost_unit_label + \
-            " (only event minutes)"             
-    })
-
-    # asseble one table view per calendar week
-    tables = list()
-
-    for calendar_week in calendar_weeks:
-            
-        week_data = [d for d in data if d["calendar_week"] == calendar_week]
-        
-        dates = [d["date"] for d in week_data]
-        
-        rows = list()
-        for row_key in row_keys:
-            row = dict()
-            row["label"] = row_labels.get(row_key, row_key) # row_key is default if no label was set
-            if decimal_hours == True: row["label"] = row["label"].replace("minutes", "hours")
-            row["highlighted"] = True if row_key in highlighted_rows else False
-            row["values"] = [d[row_key] for d in week_data]
-            rows.append(row)
-            
-        table = {
-            "title": f"Calendar Week {calendar_week}",
-            "dates": dates,
-            "colspan": len(dates) + 1,
-            "rows" : rows
-        }
+    # the browser's copy is still valid if neither stored data nor the aggregation settings changed
+    etag = aggregation_etag(request, from_date, to_date)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    def render_report() -> HTMLResponse:
+
+        # get data
+        with pinned_config() as config:
+            data = agg_time_by_cost_unit(config, from_date, to_date)
+
+        # flag if data is empty to adjust html output
+        empty_data = True if len(data) == 0 else False
+
+        tables = reports.build_tables(data, config.labels, from_date, to_date, decimal_hours, decimal_comma)
+                
+        return templates.TemplateResponse(
+            "sap_monthly_report.html", 
+            context={"request": request, "tables": tables, 
+                     "empty_data": empty_data, "from_date":from_date, "to_date":to_date}
+        )
+
+    response = await adb.run(render_report)
+    return set_etag(response, etag)
+
+
+@router.get("/sap/report", response_class=HTMLResponse)
+async def sap_range_report(
+    request: Request, from_date:date, to_date:date,
+    decimal_hours:bool | None = None, decimal_comma:bool | None = None):
+
+    """
+    Report for any date range, e.g. a quarter or a year, from a single aggregation of the whole range.
+    Shows subtotals per month and year. Week tables are loaded per month when expanded,
+    see sap_range_report_weeks.
+    """
+
+    etag = aggregation_etag(request, from_date, to_date)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    def render_report() -> HTMLResponse:
+
+        with pinned_config() as config:
+            data = agg_time_by_cost_unit(config, from_date, to_date)
+
+        empty_data = True if len(data) == 0 else False
+
+        subtotals = reports.build_subtotals(data, config.labels, decimal_hours, decimal_comma)
+
+        # week tables of a month are requested with the same parameters as the report
+        months = sorted(set(d["date"][:7] for d in data))
+        month_views = list()
+        for month in months:
+            year, month_number = month.split("-")
+            month_views.append({
+                "month": month,
+                "weeks_url": f"/sap/report/weeks?{request.query_params}&year={int(year)}&month={int(month_number)}"
+            })
+
+        return templates.TemplateResponse(
+            "sap_report.html",
+            context={"request": request, "subtotals": subtotals, "month_views": month_views,
+                     "empty_data": empty_data, "from_date":from_date, "to_date":to_date}
+        )
+
+    response = await adb.run(render_report)
+    return set_etag(response, etag)
+
+
+@router.get("/sap/report/weeks", response_class=HTMLResponse)
+async def sap_range_report_weeks(
+    request: Request, from_date:date, to_date:date, month:int, year:int,
+    decimal_hours:bool | None = None, decimal_comma:bool | None = None):
+
+    """
+    Week tables of one month of the report for given date range, as html fragment.
+    The aggregation of the whole range is served from the result cache of agg_time_by_cost_unit,
+    hence expanding a month does not run the aggregation again.
+    """
+
+    # same tables as in the monthly report, limited to the dates within the report's range
+    first_date = max(from_date, date(year, month, 1))
+    last_date = min(to_date, date(year, month, monthrange(year, month)[1]))
+
+    etag = aggregation_etag(request, from_date, to_date)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+
+    def render_weeks() -> HTMLResponse:
+
+        with pinned_config() as config:
+            data = agg_time_by_cost_unit(config, from_date, to_date)
+        month_data = [d for d in data if first_date.isoformat() <= d["date"] <= last_date.isoformat()]
+
+        tables = reports.build_tables(month_data, config.labels, date(year, month, 1), last_date, decimal_hours, decimal_comma)
+
+        return templates.TemplateResponse(
+            "_sap_report_weeks.html",
+            context={"request": request, "tables": tables}
+        )
+
+    response = await adb.run(render_weeks)
+    return set_etag(response, etag)
+
+
+@router.get("/sap/export")
+async def sap_export(
+    from_date:date, to_date:date,
+    decimal_hours:bool | None = None, decimal_comma:bool | None = None) -> StreamingResponse:
+
+    """
+    Same tables as the monthly report for any date range, as downloadable csv.
+    Aggregates the whole range at once instead of month by month.
+    """
+
+    def build_tables() -> list:
+        with pinned_config() as config:
+            data = agg_time_by_cost_unit(config, from_date, to_date)
+        return reports.build_tables(data, config.labels, from_date, to_date, decimal_hours, decimal_comma)
+
+    tables = await adb.run(build_tables)
 
-        tables.append(table)
-
-    # edge case december: might contain calendar week 1, which should be presented after calendar week 52
-    if (1 in calendar_weeks and 52 in calendar_weeks):
-        first_table = tables.pop(0)
-        first_table["title"] += " (following year)" 
-        tables.append(first_table)
-            
-    return templates.TemplateResponse(
-        "sap_monthly_report.html", 
-        context={"request": request, "tables": tables, 
-                 "empty_data": empty_data, "from_date":from_date, "to_date":to_date}
-    )
\ No newline at end of file
+    filename = f"sap_report_{from_date}_{to_date}.csv"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(reports.iter_csv(tables, decimal_comma), media_type="text/csv", headers=headers)
@@ -4,20 +4,21 @@ from fastapi.responses import RedirectResponse
 from typing import Annotated
 from datetime import date, datetime
 from calendar import monthrange
-from uuid import uuid4
+from uuid import UUID, uuid4
+import asyncio
+from concurrent.futures import Future
 
-from app.parsers.ezeit_parser import parse_working_hours, EZEIT_ERROR
-from app.parsers.outlook_parser import parse_calendar_events, OUTLOOK_ERROR
-from app.parsers.kapow_parser import parse_kapow_sessions, KAPOW_ERROR
 from app.models import EZeitDay, Event
-from lxml import etree
 from app.database import db
-from pydantic import ValidationError
+import app.database.async_db as adb
+from app.config import parse_config
 
 router = APIRouter(prefix="/api/import_files")
 
+# parsers (and lxml with them) are imported on the first upload instead of on startup
+
 @router.post("/parse")
-def parse(
+async def parse(
     month: Annotated[int, Form()],
     year: Annotated[int, Form()],
     ezeit: Annotated[UploadFile, File()],
@@ -25,63 +26,107 @@ def parse(
     kapow: Annotated[UploadFile | None, File()] = None):
 
     """Recieves files together with other types of data, requiring the use of fastapi's
-    Form() and File() factories wrapped in an 'Annotated' Object"""
+    Form() and File() factories wrapped in an 'Annotated' Object.
+    The files are parsed concurrently in a worker pool. Errors are reported
+    in the same order as if they were parsed one after another: ezeit, outlook, kapow"""
 
     # derive date boundaries for import given year and month inputs
     _, n_days_in_month = monthrange(year, month)
     min_date = date(year, month, 1)
     max_date = date(year, month, n_days_in_month)
 
+    from app.parsers import parallel
+    ezeit_job = (parallel.parse_ezeit, month, year)
+    cache_id = await _parse_and_cache(ezeit, outlook, kapow, ezeit_job, min_date, max_date)
+
+    redirect_url = f"/import_files/preview/{cache_id}?min_date={min_date}&max_date={max_date}"
+
+    return RedirectResponse(url=redirect_url, status_code=303)
+
+
+@router.post("/parse_range")
+async def parse_range(
+    min_date: Annotated[date, Form()],
+    max_date: Annotated[date, Form()],
+    ezeit: Annotated[UploadFile, File()],
+    outlook: Annotated[UploadFile, File()],
+    kapow: Annotated[UploadFile | None, File()] = None):
+
+    """Bulk import mode for an arbitrary date range, e.g. back-filling a full year at once.
+    Works like /parse, but the EZeit file has to cover every date of the range.
+    It is split by month and checked for completeness month by month.
+    All data is staged under one cache id and stored in a single transaction when confirmed."""
+
+    if min_date > max_date:
+        raise HTTPException(status_code=422, detail=f"Start date {min_date} is after end date {max_date}.")
+
+    from app.parsers import parallel
+    ezeit_job = (parallel.parse_ezeit_range, min_date, max_date)
+    cache_id = await _parse_and_cache(ezeit, outlook, kapow, ezeit_job, min_date, max_date)
+
+    redirect_url = f"/import_files/preview/{cache_id}?min_date={min_date}&max_date={max_date}"
+
+    return RedirectResponse(url=redirect_url, status_code=303)
+
+
+async def _parse_and_cache(
+    ezeit:UploadFile, outlook:UploadFile, kapow:UploadFile | None,
+    ezeit_job:tuple, min_date:date, max_date:date) -> UUID:
+    
+    """Parses all uploaded files and caches the results under a new cache id.
+    The ezeit_job holds the parser function for the EZeit file followed by its arguments after the file content."""
+
     # initiate cache for storing input files before validation
     cache_id = uuid4()
     timestamp = datetime.now()
 
-    # import required ezeit file
-    if ezeit.file.read() == b"":
-        raise HTTPException(status_code=422, detail=f"{EZEIT_ERROR}. File is required and must not be empty.")
-    else:
-        ezeit.file.seek(0)
-        try:
-            ezeit_data = parse_working_hours(ezeit.file, month=month, year=year)
-        except (ValueError, KeyError, ValidationError) as exc:
-            detail = exc.errors() if isinstance(exc, ValidationError) else str(exc)
-            raise HTTPException(status_code=422, detail=detail)
-        db.cache_data(EZeitDay, ezeit_data, cache_id, timestamp)
-
-    # import required outlook file
-    if outlook.file.read() == b"":
-        raise HTTPException(status_code=422, detail=f"{OUTLOOK_ERROR}. File is required and must not be empty.")
-    else:
-        outlook.file.seek(0)
-        try:
-            outlook_data = parse_calendar_events(outlook.file, min_date, max_date)
-        except (ValueError, ValidationError) as exc:
-            detail = exc.errors() if isinstance(exc, ValidationError) else str(exc)
-            raise HTTPException(status_code=422, detail=detail)
-        db.cache_data(Event, outlook_data, cache_id, timestamp)
-
-    # import optional kapow file
-    kapow_data = None # assume no kapow data was uploaded
-    kapow_filename = kapow.filename # empty string in case of no file
+    # read files and dispatch parsers for all non-empty files at once
+    from app.parsers import parallel
+    executor = parallel.get_executor(parse_config().parser_pool)
+
+    ezeit_content = await ezeit.read()
+    outlook_content = await outlook.read()
+
+    # kapow file is optional
+    kapow_filename = None if kapow is None else kapow.filename # empty string in case of no file
     kapow_filename = None if kapow_filename == "" else kapow_filename # empt string to None for explicitness
+    kapow_content = None if kapow_filename is None else await kapow.read()
 
-    if kapow_filename is None:
-        pass
-    elif kapow_filename is not None and kapow.file.read() == b"":
-        raise HTTPException(status_code=422, detail=f"{KAPOW_ERROR}. File is optional but cannot be empty when provided.")
-    else:
-        kapow.file.seek(0)
-        try:
-            kapow_data = parse_kapow_sessions(kapow.file, min_date, max_date)
-        except (ValidationError, etree.XMLSyntaxError) as exc:
-            detail = None
-            if isinstance(exc, ValidationError):
-                detail = exc.errors()
-            else:
-                detail = f"{KAPOW_ERROR}. A parsing error occured: " + str(exc)
-            raise HTTPException(status_code=422, detail=detail)
-        db.cache_data(Event, kapow_data, cache_id, timestamp)
+    ezeit_future, outlook_future, kapow_future = None, None, None
+    if ezeit_content != b"":
+        ezeit_parser, *ezeit_args = ezeit_job
+        ezeit_future = executor.submit(ezeit_parser, ezeit_content, *ezeit_args)
+    if outlook_content != b"":
+        outlook_future = executor.submit(parallel.parse_outlook, outlook_content, min_date, max_date)
+    if kapow_content:
+        kapow_future = executor.submit(parallel.parse_kapow, kapow_content, min_date, max_date)
 
-    redirect_url = f"/import_files/preview/{cache_id}?min_date={min_date}&max_date={max_date}"
+    # required ezeit file
+    if ezeit_future is None:
+        raise HTTPException(status_code=422, detail=f"{parallel.EZEIT_ERROR}. File is required and must not be empty.")
+    ezeit_data = await _result_or_422(ezeit_future)
 
-    return RedirectResponse(url=redirect_url, status_code=303)
+    # required outlook file
+    if outlook_future is None:
+        raise HTTPException(status_code=422, detail=f"{parallel.OUTLOOK_ERROR}. File is required and must not be empty.")
+    outlook_data = await _result_or_422(outlook_future)
+
+    # optional kapow file
+    imports = [(EZeitDay, ezeit_data), (Event, outlook_data)]
+    if kapow_filename is not None and kapow_future is None:
+        raise HTTPException(status_code=422, detail=f"{parallel.KAPOW_ERROR}. File is optional but cannot be empty when provided.")
+    if kapow_future is not None:
+        imports.append((Event, await _result_or_422(kapow_future)))
+
+    # cache all parsed data in one transaction
+    await adb.run(db.cache_data_many, imports, cache_id, timestamp, write=True)
+
+    return cache_id
+
+
+async def _result_or_422(future:Future) -> list:
+    """Waits for a parser job and turns expected parsing errors into http exceptions"""
+    data, error_detail = await asyncio.wrap_future(future)
+    if error_detail is not None:
+        raise HTTPException(status_code=422, detail=error_detail)
+    return data
@@ -1,64 +1,159 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 import app.models as mo
 from app.models import EventSources as IMS, DayCategories as EZC
-import app.database.sqlite_operations as sql_ops
+import app.database.async_db as adb
+import app.database.data_versions as data_versions
+from app.etags import make_etag, is_not_modified, not_modified, set_etag
 from typing import Literal
+from datetime import date
+import base64
+import json
+import random as rnd
 
 router = APIRouter(prefix="/api")
 
 EZEIT_TABLE = mo.EZeitDay.table_name
 EVENT_TABLE = mo.Event.table_name
 
+# ---------------------------------------------------------------------------------------
+# Pagination
+#   - pages are read by passing the next_cursor of the previous page as cursor (keyset pagination):
+#       https://use-the-index-luke.com/no-offset
+#     each page starts right after the last row of the previous one through the index on
+#     the sort key, so reading all pages is linear in the number of rows
+#   - the deprecated offset is still supported for pages without cursor
+#   - random samples pick random rowids instead of sorting the whole table by RANDOM()
+#   - pages carry an ETag based on the data version of the requested date range, 
+#     unchanged pages are revalidated without querying them again. Random samples never are.
+# ---------------------------------------------------------------------------------------
 
-@router.get(f"/{EZEIT_TABLE}")
-def get_ezeit(limit:int=10, offset:int=0, on_work:bool=False,
-    random:bool=False, ids_only:bool=False) -> mo.EZeitDayList:
-    
-    columns = "id" if ids_only else "*"
-    sql = f"SELECT {columns} FROM {EZEIT_TABLE}"
-    
-    conditions = list()
-    if on_work:
-        conditions.append(f"day_category = '{EZC.ON_WORK.value}'")
-    if conditions:
-        conditions = " AND ".join(conditions)
-        sql += " WHERE " + conditions
 
-    order_by = "RANDOM()" if random else "date"
-    sql += f" ORDER BY {order_by} LIMIT {limit} OFFSET {offset};"
+@router.get(f"/{EZEIT_TABLE}")
+async def get_ezeit(request:Request, response:Response, limit:int=10, cursor:str | None = None, on_work:bool=False,
+    from_date:date | None = None, to_date:date | None = None,
+    random:bool=False, ids_only:bool=False, offset:int = Query(default=0, deprecated=True)) -> mo.EZeitDayList:
 
-    print(sql)
+    etag = None if random else make_etag(request, _data_version(from_date, to_date))
+    if etag is not None and is_not_modified(request, etag):
+        return not_modified(etag)
 
-    data = sql_ops.fetch_all_as_dicts(sql)
-    response = {
-        "data": data
-    }
-    return response
+    conditions, params = list(), dict()
+    if on_work:
+        conditions.append("day_category = :day_category")
+        params["day_category"] = EZC.ON_WORK.value
+    add_date_range(conditions, params, "date", from_date, to_date)
 
+    page = await _get_page(EZEIT_TABLE, "date", conditions, params, limit, cursor, offset, random, ids_only)
+    if etag is not None:
+        set_etag(response, etag)
+    return page
 
 
 @router.get(f"/{EVENT_TABLE}")
-def get_workevents(limit:int=10, offset:int=0, source:Literal[IMS.KAPOW, IMS.OUTLOOK] | None = None,
-    random:bool=False, ids_only:bool=False) -> mo.EventList:
-    
-    columns = "id" if ids_only else "*"
-    sql = f"SELECT {columns} FROM {EVENT_TABLE}"
-    
-    conditions = list()
+async def get_workevents(request:Request, response:Response, limit:int=10, cursor:str | None = None, source:Literal[IMS.KAPOW, IMS.OUTLOOK] | None = None,
+    from_date:date | None = None, to_date:date | None = None,
+    random:bool=False, ids_only:bool=False, offset:int = Query(default=0, deprecated=True)) -> mo.EventList:
+
+    etag = None if random else make_etag(request, _data_version(from_date, to_date))
+    if etag is not None and is_not_modified(request, etag):
+        return not_modified(etag)
+
+    conditions, params = list(), dict()
     if source:
-        conditions.append(f"source = '{source}'")
+        conditions.append("source = :source")
+        params["source"] = source
+    add_date_range(conditions, params, mo.Event.date_column, from_date, to_date)
+
+    page = await _get_page(EVENT_TABLE, "start", conditions, params, limit, cursor, offset, random, ids_only)
+    if etag is not None:
+        set_etag(response, etag)
+    return page
+
+
+def _data_version(from_date:date | None, to_date:date | None) -> int:
+    return data_versions.version_of(from_date or date.min, to_date or date.max)
+
+
+def add_date_range(conditions:list[str], params:dict, date_column:str, from_date:date | None, to_date:date | None) -> None:
+    if from_date is not None:
+        conditions.append(f"{date_column} >= :from_date")
+        params["from_date"] = from_date.isoformat()
+    if to_date is not None:
+        conditions.append(f"{date_column} <= :to_date")
+        params["to_date"] = to_date.isoformat()
+
+
+async def _get_page(table:str, sort_key:str, conditions:list[str], params:dict,
+    limit:int, cursor:str | None, offset:int, random:bool, ids_only:bool) -> dict:
+    """Returns a page of rows sorted by (sort_key, id), or a random sample of rows if random is set.
+    The response contains the cursor of the next page, which is None on the last page."""
+
+    columns = f"id, {sort_key}" if ids_only else "*"
+    params["limit"] = limit
+
+    if random:
+        data = await _get_sample(table, columns, conditions, params, limit)
+        return {"data": data, "next_cursor": None}
+
+    if cursor is not None:
+        conditions = conditions + [f"({sort_key}, id) > (:cursor_key, :cursor_id)"]
+        params["cursor_key"], params["cursor_id"] = _decode_cursor(cursor)
+        offset = 0
+
+    sql = f"SELECT {columns} FROM {table}"
     if conditions:
-        conditions = " AND ".join(conditions)
-        sql += " WHERE " + conditions
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {sort_key}, id LIMIT :limit OFFSET :offset;"
+    params["offset"] = offset
+
+    data = await adb.fetch_all_as_dicts(sql, params)
+
+    next_cursor = None
+    if len(data) == limit and limit > 0:
+        next_cursor = _encode_cursor(data[-1][sort_key], data[-1]["id"])
+
+    return {"data": data, "next_cursor": next_cursor}
+
+
+async def _get_sample(table:str, columns:str, conditions:list[str], params:dict, limit:int) -> list[dict]:
+    """Random rows without sorting the whole table: random rowids between the smallest and largest
+    matching rowid are resolved to the next matching row. Picking more rowids than needed makes up for duplicates.
+    Only if the matches are too few to fill the sample, they are sorted randomly instead."""
+
+    where = " AND ".join(conditions) if conditions else "1"
+    params["attempts"] = 4 * limit
+
+    # each recursive step has to refer to the current pick, otherwise sqlite draws RANDOM() only once
+    sql = f"""WITH RECURSIVE
+        bounds(lo, hi) AS (SELECT MIN(rowid), MAX(rowid) FROM {table} WHERE {where}),
+        picks(i, r) AS (
+            SELECT 1, lo + ABS(RANDOM()) % (hi - lo + 1) FROM bounds WHERE lo IS NOT NULL
+            UNION ALL
+            SELECT i + 1, lo + ABS(RANDOM()) % (hi - lo + 1) FROM picks, bounds WHERE i < :attempts
+        )
+        SELECT {columns} FROM {table} WHERE rowid IN (
+            SELECT (SELECT rowid FROM {table} WHERE rowid >= r AND {where} ORDER BY rowid LIMIT 1) FROM picks
+        ) LIMIT :limit;"""
+    data = await adb.fetch_all_as_dicts(sql, params)
+
+    if len(data) < limit:
+        sql = f"SELECT {columns} FROM {table} WHERE {where} ORDER BY RANDOM() LIMIT :limit;"
+        data = await adb.fetch_all_as_dicts(sql, params)
+
+    rnd.shuffle(data)
+    return data
+
 
-    order_by = "RANDOM()" if random else "start"
-    sql += f" ORDER BY {order_by} LIMIT {limit} OFFSET {offset};"
+def _encode_cursor(key:str, id:str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([key, id]).encode("utf-8")).decode("ascii")
 
-    print(sql)
 
-    params = dict()
-    data = sql_ops.fetch_all_as_dicts(sql, params)
-    response = {
-        "data": data
-    }
-    return response
\ No newline at end of file
+def _decode_cursor(cursor:str) -> tuple[str, str]:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not (isinstance(decoded, list) and len(decoded) == 2 and all(isinstance(v, str) for v in decoded)):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid cursor: {cursor}")
+    key, id = decoded
+    return key, id
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, status
+import app.database.sqlite_operations as sql_ops
+
+router = APIRouter(prefix="/api")
+
+
+@router.get("/sql_metrics")
+async def get_sql_metrics() -> dict:
+    """Query statistics per statement template, sorted by total time spent.
+    Metrics are only collected if enabled in the configuration under 'sql_instrumentation'."""
+
+    if sql_ops.METRICS is None:
+        return {"enabled": False, "statements": []}
+
+    return {
+        "enabled": True,
+        "slow_query_threshold_ms": sql_ops.METRICS.slow_query_threshold_ms,
+        "statements": sql_ops.METRICS.snapshot()
+    }
+
+
+@router.delete("/sql_metrics", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_sql_metrics() -> None:
+    if sql_ops.METRICS is not None:
+        sql_ops.METRICS.reset()
@@ -0,0 +1,227 @@
+from datetime import date
+from decimal import Decimal, ROUND_FLOOR
+from typing import Callable, Iterator
+from functools import cache
+import csv
+import io
+
+from app.models import DayCategories as EZC
+
+# ---------------------------------------------------------------------------------------
+# SAP cost accounting report
+#   - turns the result of agg_time_by_cost_unit into one table per calendar week,
+#     used for the html report as well as the csv export
+#   - the data structure of the tables:
+#       [
+#           {
+#               "title": "Calendar Week 1",
+#               "dates": ["2025-06-01", "2025-06-02", "2025-06-03"],
+#               "colspan": 4,
+#               "rows": [
+#                   {"label": "a", "highlighted": false, "values": [7.5, 2.0, 0.0]},
+#                   {"label": "b", "highlighted": true, "values": [0.0, 8.0, 1.25]},
+#                   ...
+#               ]
+#           },
+#           ...
+#       ]
+#   - subtotals per month and year share this structure, with months instead of dates
+# ---------------------------------------------------------------------------------------
+
+COST_UNITS_DEFAULT = ["default_cost_unit", "overhead"]
+
+
+def build_tables(data:list[dict], labels:dict[str, str], from_date:date, to_date:date,
+    decimal_hours:bool | None = None, decimal_comma:bool | None = None) -> list[dict]:
+    """Segments the aggregated data into calendar weeks, in order of time.
+    Weeks belonging to another year than the report are marked as such in their title,
+    e.g. calendar week 1 at the end of december. Reports spanning multiple years name the year of each week.
+
+    The data is processed column by column: each row of the tables is sliced from one column,
+    calendar weeks are derived in a single pass over the dates and every distinct number
+    is converted to decimal hours only once."""
+
+    row_keys, row_labels, highlighted_rows = _row_layout(labels, decimal_hours)
+
+    # turn rows of the aggregation into columns
+    dates = [d["date"] for d in data]
+    columns = {k: [d[k] for d in data] for k in row_keys}
+
+    # calculate decimal hours, always rounding off to 2 decimal places
+    if decimal_hours == True:
+        to_hours = _decimal_hours_converter(decimal_comma)
+        for k, column in columns.items():
+            columns[k] = [to_hours(v) if isinstance(v, int) else v for v in column]
+
+    # group positions of dates by calendar week (with its year, as weeks may span the turn of the year)
+    positions_by_week = dict()
+    for i, d in enumerate(dates):
+        iso_year, week, _ = date.fromisoformat(d).isocalendar()
+        positions_by_week.setdefault((iso_year, week), []).append(i)
+
+    # asseble one table view per calendar week
+    tables = list()
+
+    for calendar_week in sorted(positions_by_week):
+
+        positions = positions_by_week[calendar_week]
+        week_dates = [dates[i] for i in positions]
+
+        rows = [
+            {
+                "label": row_labels[k],
+                "highlighted": k in highlighted_rows,
+                "values": [columns[k][i] for i in positions]
+            }
+            for k in row_keys
+        ]
+
+        tables.append({
+            "title": _week_title(calendar_week, from_date, to_date),
+            "dates": week_dates,
+            "colspan": len(week_dates) + 1,
+            "rows" : rows
+        })
+
+    return tables
+
+
+def build_subtotals(data:list[dict], labels:dict[str, str],
+    decimal_hours:bool | None = None, decimal_comma:bool | None = None) -> list[dict]:
+    """Sums up the aggregated data per month, one table per year with a column per month
+    followed by the total of the year. The first row counts the days on work.
+
+    Sums are built from minutes and converted to decimal hours afterwards, hence they may differ
+    by a few hundredths from the sum of the rounded hours shown for single days."""
+
+    row_keys, row_labels, highlighted_rows = _row_layout(labels, decimal_hours)
+    sum_keys = [k for k in row_keys if k != "day_category"]
+
+    # sum up minutes per month, months are the first 7 characters of an iso date
+    totals_by_month = dict()
+    for d in data:
+        month = d["date"][:7]
+        if month not in totals_by_month:
+            totals_by_month[month] = dict.fromkeys(sum_keys + ["on_work_days"], 0)
+        totals = totals_by_month[month]
+        totals["on_work_days"] += d["day_category"] == EZC.ON_WORK.value
+        for k in sum_keys:
+            totals[k] += d[k]
+
+    months_by_year = dict()
+    for month in sorted(totals_by_month):
+        months_by_year.setdefault(month[:4], []).append(month)
+
+    to_hours = _decimal_hours_converter(decimal_comma) if decimal_hours == True else None
+
+    # assemble one table view per year
+    tables = list()
+
+    for year, months in months_by_year.items():
+
+        columns = [totals_by_month[m] for m in months]
+        columns.append({k: sum(c[k] for c in columns) for k in columns[0]})
+
+        rows = [{
+            "label": "Days on work",
+            "highlighted": False,
+            "values": [c["on_work_days"] for c in columns]
+        }]
+        for k in sum_keys:
+            values = [c[k] for c in columns]
+            if to_hours is not None:
+                values = [to_hours(v) for v in values]
+            rows.append({"label": row_labels[k], "highlighted": k in highlighted_rows, "values": values})
+
+        tables.append({
+            "title": f"Subtotals {year}",
+            "dates": months + ["Total"],
+            "colspan": len(columns) + 1,
+            "rows": rows
+        })
+
+    return tables
+
+
+def _decimal_hours_converter(decimal_comma:bool | None) -> Callable[[int], Decimal | str]:
+    """Returns a function converting minutes to hours, rounded off to 2 decimal places.
+    Reports contain few distinct numbers, hence each one is only converted once."""
+
+    @cache
+    def to_hours(minutes:int) -> Decimal | str:
+        number = Decimal(minutes / 60)
+        number = number.quantize(Decimal('0.01'), rounding=ROUND_FLOOR)
+        if decimal_comma == True:
+            number = str(number).replace(".", ",")
+        return number
+
+    return to_hours
+
+
+def _row_layout(labels:dict[str, str], decimal_hours:bool | None) -> tuple[list[str], dict[str, str], set[str]]:
+    """Returns order, labels and highlighting of the rows in each table.
+    Labels are given per cost unit in configured order, see config.ConfigSnapshot.labels"""
+
+    # segregate default and user defined cost units for table layout costomization
+    cost_units_user_defined = [k for k in labels.keys() if k not in COST_UNITS_DEFAULT]
+
+    # define rows to be highlighted
+    highlighted_rows = set()
+    highlighted_rows.add("default_cost_unit_inkl_non_event_minutes")
+    highlighted_rows.update(cost_units_user_defined)
+
+    # set row order
+    row_keys = \
+        ["day_category", "default_cost_unit_inkl_non_event_minutes"] + \
+        cost_units_user_defined + \
+        COST_UNITS_DEFAULT + \
+        ["booked_minutes", "event_minutes", "non_event_minutes"]
+
+    # set row labels
+    row_labels = dict(labels)
+    default_cost_unit_label = labels["default_cost_unit"]
+    row_labels.update({
+        "default_cost_unit_inkl_non_event_minutes": \
+            default_cost_unit_label + \
+            " (incl. non-event minutes)",
+        "default_cost_unit": \
+            default_cost_unit_label + \
+            " (only event minutes)"
+    })
+    row_labels = {k: row_labels.get(k, k) for k in row_keys} # row_key is default if no label was set
+    if decimal_hours == True:
+        row_labels = {k: v.replace("minutes", "hours") for k, v in row_labels.items()}
+
+    return row_keys, row_labels, highlighted_rows
+
+
+def _week_title(calendar_week:tuple[int, int], from_date:date, to_date:date) -> str:
+    iso_year, week = calendar_week
+    title = f"Calendar Week {week}"
+    if from_date.year != to_date.year:
+        title += f" ({iso_year})"
+    elif iso_year > from_date.year:
+        title += " (following year)"
+    elif iso_year < from_date.year:
+        title += " (previous year)"
+    return title
+
+
+def iter_csv(tables:list[dict], decimal_comma:bool | None = None) -> Iterator[str]:
+    """Writes the tables one below the other, separated by an empty line.
+    Each table starts with its title, followed by a header of dates and one line per row.
+    Fields are separated by semicolons when decimal commas are used, as usual in german spreadsheets."""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";" if decimal_comma == True else ",")
+
+    for i, table in enumerate(tables):
+        if i > 0:
+            writer.writerow([])
+        writer.writerow([table["title"]])
+        writer.writerow(["Row Name"] + table["dates"])
+        for row in table["rows"]:
+            writer.writerow([row["label"]] + row["values"])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,96 @@
+import sys
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from importlib.machinery import ModuleSpec
+from typing import Iterator
+
+# ---------------------------------------------------------------------------------------
+# Startup profiling, enabled by running the app with --profile-startup (see pyinstaller_entrypoint.py)
+#   - import times are measured per module like with python -X importtime,
+#     which is not available in a pyinstaller bundle
+#   - steps of the startup itself, e.g. initiating the database, are timed with step()
+#     in the lifespan of the app. Steps are always timed, since it costs next to nothing
+#   - only imports of the main thread are measured
+# ---------------------------------------------------------------------------------------
+
+# module, self time, cumulative time (incl. nested imports), nesting depth
+_imports: list[tuple[str, float, float, int]] = list()
+_nested: list[float] = list() # time spent in nested imports, per module being imported
+_steps: list[tuple[str, float]] = list()
+
+
+class _TimingFinder(MetaPathFinder):
+    """Finds modules through the other finders and times the execution of each found module"""
+
+    def find_spec(self, name:str, path, target=None) -> ModuleSpec | None:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader)
+                return spec
+        return None
+
+
+class _TimingLoader:
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def create_module(self, spec:ModuleSpec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        # the module keeps its original loader, e.g. for reading package resources
+        module.__spec__.loader = module.__loader__ = self.loader
+
+        _nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            nested = _nested.pop()
+            if _nested:
+                _nested[-1] += cumulative
+            _imports.append((module.__name__, cumulative - nested, cumulative, len(_nested)))
+
+
+def profile_imports() -> None:
+    """Times all imports from now on, has to be called before importing the app"""
+    sys.meta_path.insert(0, _TimingFinder())
+
+
+@contextmanager
+def step(name:str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps.append((name, time.perf_counter() - start))
+
+
+def report(n_imports:int = 30) -> str:
+    """Lists the slowest imports by cumulative time, the imports of the app itself and all startup steps"""
+
+    lines = list()
+    row = "{:>10} | {:>10} | {}"
+
+    top_level = [i for i in _imports if i[3] == 0]
+    lines.append(f"Imports: {len(_imports)} modules, {sum(i[2] for i in top_level) * 1000:.1f} ms in total")
+    lines.append(row.format("self [ms]", "cum. [ms]", "module"))
+
+    slowest = sorted(_imports, key=lambda i: i[2], reverse=True)[:n_imports]
+    app_modules = [i for i in _imports if i[0] == "app" or i[0].startswith("app.")]
+    for module, self_time, cumulative, _ in slowest + [i for i in app_modules if i not in slowest]:
+        lines.append(row.format(f"{self_time * 1000:.1f}", f"{cumulative * 1000:.1f}", module))
+
+    lines.append("")
+    lines.append("Startup steps")
+    for name, duration in _steps:
+        lines.append(row.format("", f"{duration * 1000:.1f}", name))
+
+    return "\n".join(lines)
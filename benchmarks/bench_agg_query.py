@@ -0,0 +1,51 @@
+"""Per-request overhead of preparing the agg_time_by_cost_unit sql.
+
+Compares reading and templating the sql file on every request, as done before,
+with the precompiled statement handed out by AggTimeByCostUnitQuery.
+Run from the project root: python benchmarks/bench_agg_query.py
+"""
+import json
+import timeit
+import sys
+from pathlib import Path
+sys.path.append(Path(__file__).parents[1].as_posix())
+
+from app.config import parse_config, get_root_path
+from app.database.query_builder import AggTimeByCostUnitQuery
+
+CONFIG = parse_config()
+TEMPLATE_FILEPATH = get_root_path() / "app/routers/agg_time_by_cost_unit.sql"
+N = 10_000
+
+
+def per_request_templating() -> tuple[str, str]:
+    """Reproduces the former per-request preparation of sql and parameters"""
+
+    with open(TEMPLATE_FILEPATH,  "r", encoding="utf-8") as f:
+        sql_template = f.read()
+
+    sql_pivot_statements = list()
+    sql_sum_columns = list()
+    for cost_unit in CONFIG.cost_units.keys():
+        sql_pivot_statements.append(f"MAX(CASE WHEN cost_unit = '{cost_unit}' THEN event_time_in_cost_unit ELSE 0 END) AS '{cost_unit}'")
+        sql_sum_columns.append(f"e.{cost_unit}")
+
+    sql = sql_template.format(
+        sql_pivot_statements = ", ".join(sql_pivot_statements),
+        sql_sum_columns = " + ".join(sql_sum_columns)
+    )
+    cost_units = json.dumps(CONFIG.model_dump()["cost_units"])
+    return sql, cost_units
+
+
+if __name__ == "__main__":
+
+    query = AggTimeByCostUnitQuery(TEMPLATE_FILEPATH)
+    assert query.sql(CONFIG.cost_units.keys()) == per_request_templating()[0]
+
+    before = timeit.timeit(per_request_templating, number=N) / N * 1e6
+    after = timeit.timeit(lambda: query.sql(CONFIG.cost_units.keys()), number=N) / N * 1e6
+
+    print(f"per request templating:  {before:8.2f} µs")
+    print(f"precompiled statement:   {after:8.2f} µs")
+    print(f"speedup:                 {before / after:8.1f}x")
@@ -0,0 +1,88 @@
+"""Interval engine: minutes per date and cost unit for each overlap policy.
+
+Generates synthetic events for several years, with meetings overlapping each other and kapow sessions,
+checks the results against a minute by minute count and measures the runtime per policy.
+Run from the project root: python benchmarks/bench_interval_engine.py
+"""
+import random
+import sys
+import timeit
+import datetime as dt
+from collections import defaultdict
+from pathlib import Path
+sys.path.append(Path(__file__).parents[1].as_posix())
+
+from app.interval_engine import minutes_by_cost_unit
+
+N_REPEAT = 3
+N_YEARS = 5
+N_EVENTS_PER_DAY = 8
+COST_UNITS = {"outlook": ["default_cost_unit", "overhead", "mrh", "cut"], "kapow": ["mrh", "cut"]}
+SOURCE_PRIORITY = ["kapow", "outlook"]
+
+
+def generate_events(from_date:dt.date, n_days:int) -> list[dict]:
+    """Events start and end on full minutes, so minutes can be counted one by one for reference"""
+    events = list()
+    for i in range(n_days):
+        day = from_date + dt.timedelta(days=i)
+        if day.weekday() > 4:
+            continue
+        for _ in range(N_EVENTS_PER_DAY):
+            source = random.choice(["outlook", "outlook", "kapow"])
+            start = dt.datetime.combine(day, dt.time(8)) + dt.timedelta(minutes=random.randrange(0, 540, 5))
+            end = start + dt.timedelta(minutes=random.choice([15, 30, 45, 60, 90]))
+            events.append({
+                "id": f"{day}-{len(events)}", "source": source,
+                "start": start.isoformat(), "end": end.isoformat(), "date": day.isoformat(),
+                "cost_unit": random.choice(COST_UNITS[source])
+            })
+    return events
+
+
+def count_minute_by_minute(events:list[dict], policy:str) -> tuple[dict, int]:
+    """Reference: resolves every minute of every date separately. Returns minutes and total overlapping minutes"""
+
+    ranks = {s: i for i, s in enumerate(SOURCE_PRIORITY)}
+    active_by_minute = defaultdict(list)
+    for e in events:
+        start, end = dt.datetime.fromisoformat(e["start"]), dt.datetime.fromisoformat(e["end"])
+        for m in range(int((end - start).total_seconds()) // 60):
+            active_by_minute[(e["date"], start + dt.timedelta(minutes=m))].append(e)
+
+    minutes = defaultdict(lambda: defaultdict(int))
+    overlapping = 0
+    for (day, minute), active in active_by_minute.items():
+        if len(active) > 1:
+            overlapping += 1
+        if policy == "count_all":
+            for e in active:
+                minutes[day][e["cost_unit"]] += 1
+        elif policy == "merge":
+            for cost_unit in set(e["cost_unit"] for e in active):
+                minutes[day][cost_unit] += 1
+        else:
+            winner = min(active, key=lambda e: (ranks[e["source"]], e["start"], events.index(e)))
+            minutes[day][winner["cost_unit"]] += 1
+
+    return {day: dict(m) for day, m in minutes.items()}, overlapping
+
+
+if __name__ == "__main__":
+
+    random.seed(0)
+
+    # check against the reference on a few months, counting minute by minute is slow
+    events = generate_events(dt.date(2024, 1, 1), 90)
+    for policy in ["count_all", "merge", "source_priority"]:
+        minutes, overlaps = minutes_by_cost_unit(events, policy, SOURCE_PRIORITY)
+        expected, overlapping = count_minute_by_minute(events, policy)
+        assert minutes == expected, f"Minutes differ for policy {policy}"
+        assert sum(o["minutes"] for o in overlaps) == overlapping, f"Overlaps differ for policy {policy}"
+    print(f"{len(events)} events, {len(overlaps)} overlaps ({overlapping} minutes): all policies match the reference")
+
+    events = generate_events(dt.date(2020, 1, 1), N_YEARS * 365)
+    print(f"{len(events)} events in {N_YEARS} years")
+    for policy in ["count_all", "merge", "source_priority"]:
+        seconds = timeit.timeit(lambda: minutes_by_cost_unit(events, policy, SOURCE_PRIORITY), number=N_REPEAT) / N_REPEAT
+        print(f"{policy:<16} {seconds * 1000:8.1f} ms")
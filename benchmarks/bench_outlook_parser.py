@@ -0,0 +1,97 @@
+"""Outlook import: former parse_calendar_events vs. the current implementation.
+
+Generates a synthetic full-year calendar export with a few duplicated events,
+checks that both implementations return the same events and compares their runtime.
+Run from the project root: python benchmarks/bench_outlook_parser.py
+"""
+import io
+import json
+import timeit
+import random
+import sys
+import datetime as dt
+from pathlib import Path
+sys.path.append(Path(__file__).parents[1].as_posix())
+
+from app.models import Event, EventSources
+from app.parsers.utils import csv_dict_reader, check_mandatory_columns
+from app.parsers.outlook_parser import parse_calendar_events, MANDATORY_COLUMNS, OUTLOOK_ERROR
+
+N_REPEAT = 5
+
+
+def legacy_parse_calendar_events(file, min_date:dt.date, max_date:dt.date) -> list[Event]:
+    """parse_calendar_events as implemented before, without printing the result"""
+
+    rows = csv_dict_reader(file, sep=",")
+    rows = [row for row in rows if any(row.values())]
+    columns_recieved = rows[0].keys()
+    check_mandatory_columns(MANDATORY_COLUMNS, columns_recieved, OUTLOOK_ERROR)
+
+    rows = list({json.dumps(row, sort_keys=True) for row in rows})
+    rows = [json.loads(row) for row in rows]
+    
+    for row in rows:
+        start = row["Beginnt am"] + "." + row["Beginnt um"]
+        row["start"] = dt.datetime.strptime(start, "%d.%m.%Y.%H:%M:%S")
+        end = row["Endet am"] + "." + row["Endet um"]
+        row["end"] = dt.datetime.strptime(end, "%d.%m.%Y.%H:%M:%S")
+        categories = row["Kategorien"]
+        if categories == "" or categories is None:
+            categories = "outlook_default"
+        row["categories"] = json.dumps(categories.split(";"))
+        row["source"] = EventSources.OUTLOOK.value
+        row["additional_metadata"] = None
+
+    rows.sort(key=lambda r: r["start"])
+    _in_date_range = lambda x: min_date <= x.date() <= max_date
+    rows = [row for row in rows if _in_date_range(row["start"])]
+    rows = [Event.model_validate(row) for row in rows]
+    return rows
+
+
+def generate_export(year:int, events_per_day:int = 8) -> bytes:
+
+    random.seed(0)
+    categories = ["", "routine", "mrh", "cut;routine", "gemeinkosten"]
+    lines = ["Betreff,Beginnt am,Beginnt um,Endet am,Endet um,Kategorien,Ort"]
+
+    day = dt.date(year, 1, 1)
+    while day.year == year:
+        for i in range(events_per_day):
+            d = day.strftime("%d.%m.%Y")
+            lines.append(f"Meeting {i},{d},{8 + i:02d}:00:00,{d},{8 + i:02d}:45:00,{random.choice(categories)},Raum {i}")
+        day += dt.timedelta(days=1)
+
+    lines.extend(random.sample(lines[1:], 50)) # duplicates due to synchronization issues
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _comparable(events:list[Event]) -> list[dict]:
+    return [e.model_dump(exclude={"id"}) for e in events]
+
+
+if __name__ == "__main__":
+
+    export = generate_export(2025)
+    ranges = {
+        "one month": (dt.date(2025, 6, 1), dt.date(2025, 6, 30)),
+        "full year": (dt.date(2025, 1, 1), dt.date(2025, 12, 31))
+    }
+
+    for label, (min_date, max_date) in ranges.items():
+
+        legacy = lambda: legacy_parse_calendar_events(io.BytesIO(export), min_date, max_date)
+        current = lambda: parse_calendar_events(io.BytesIO(export), min_date, max_date)
+
+        # events starting at the same time were returned in arbitrary order before, hence sorted
+        key = lambda e: (e["start"], json.dumps(e, default=str))
+        assert sorted(_comparable(legacy()), key=key) == sorted(_comparable(current()), key=key)
+
+        before = min(timeit.repeat(legacy, number=1, repeat=N_REPEAT)) * 1000
+        after = min(timeit.repeat(current, number=1, repeat=N_REPEAT)) * 1000
+
+        print(f"{label} ({len(current())} events)")
+        print(f"    legacy:   {before:8.1f} ms")
+        print(f"    current:  {after:8.1f} ms")
+        print(f"    speedup:  {before / after:8.1f}x")
@@ -0,0 +1,117 @@
+"""SAP report tables: former row by row implementation vs. the current column by column one.
+
+Generates synthetic aggregation results for several years,
+checks that both implementations return the same tables and compares their runtime.
+The check also covers monthly reports at the turn of a year, which list weeks of the previous or following year.
+Run from the project root: python benchmarks/bench_sap_report.py
+"""
+import copy
+import random
+import sys
+import timeit
+import datetime as dt
+from decimal import Decimal, ROUND_FLOOR
+from pathlib import Path
+sys.path.append(Path(__file__).parents[1].as_posix())
+
+from app.config import current_config
+from app.sap_report import build_tables, _row_layout, _week_title
+
+N_REPEAT = 5
+N_YEARS = 5
+
+# months starting or ending with a week of another year, and the title expected for that week
+TURN_OF_YEAR_MONTHS = [
+    (2021, 1, 0, "Calendar Week 53 (previous year)"),
+    (2023, 1, 0, "Calendar Week 52 (previous year)"),
+    (2024, 12, -1, "Calendar Week 1 (following year)")
+]
+
+
+def legacy_build_tables(data, labels, from_date, to_date, decimal_hours=None, decimal_comma=None):
+    """build_tables as implemented before"""
+
+    if decimal_hours == True:
+        for row in data:
+            for k, v in row.items():
+                if isinstance(v, int):
+                    number = Decimal(v / 60)
+                    number = number.quantize(Decimal('0.01'), rounding=ROUND_FLOOR)
+                    if decimal_comma == True:
+                        number = str(number).replace(".", ",")
+                    row[k] = number
+
+    for d in data:
+        iso_year, week, _ = dt.date.fromisoformat(d["date"]).isocalendar()
+        d["calendar_week"] = (iso_year, week)
+
+    calendar_weeks = sorted(list(set(d["calendar_week"] for d in data)))
+
+    row_keys, row_labels, highlighted_rows = _row_layout(labels, decimal_hours)
+
+    tables = list()
+    for calendar_week in calendar_weeks:
+        week_data = [d for d in data if d["calendar_week"] == calendar_week]
+        dates = [d["date"] for d in week_data]
+        rows = list()
+        for row_key in row_keys:
+            row = dict()
+            row["label"] = row_labels[row_key]
+            row["highlighted"] = True if row_key in highlighted_rows else False
+            row["values"] = [d[row_key] for d in week_data]
+            rows.append(row)
+        tables.append({
+            "title": _week_title(calendar_week, from_date, to_date),
+            "dates": dates,
+            "colspan": len(dates) + 1,
+            "rows" : rows
+        })
+    return tables
+
+
+def generate_data(labels, from_date:dt.date, n_days:int) -> list[dict]:
+    data = list()
+    for i in range(n_days):
+        day = from_date + dt.timedelta(days=i)
+        on_work = day.weekday() < 5
+        row = {"date": day.isoformat(), "day_category": "on_work" if on_work else "off_work"}
+        row["booked_minutes"] = 480 if on_work else 0
+        for cost_unit in labels:
+            row[cost_unit] = random.choice([0, 15, 20, 30, 45, 50, 60, 90]) if on_work else 0
+        row["event_minutes"] = sum(row[c] for c in labels)
+        row["event_minutes_exceed_booked_minutes"] = 0
+        row["non_event_minutes"] = row["booked_minutes"] - row["event_minutes"]
+        row["default_cost_unit_inkl_non_event_minutes"] = row["default_cost_unit"] + row["non_event_minutes"]
+        data.append(row)
+    return data
+
+
+if __name__ == "__main__":
+
+    random.seed(0)
+    labels = current_config().labels
+    from_date = dt.date(2020, 1, 1)
+    to_date = dt.date(2020 + N_YEARS - 1, 12, 31)
+    data = generate_data(labels, from_date, (to_date - from_date).days + 1)
+
+    for options in [(None, None), (True, None), (True, True)]:
+        legacy = legacy_build_tables(copy.deepcopy(data), labels, from_date, to_date, *options)
+        current = build_tables(copy.deepcopy(data), labels, from_date, to_date, *options)
+        assert legacy == current, f"Results differ for decimal_hours, decimal_comma = {options}"
+    print(f"{len(data)} days, {len(current)} weeks: identical tables")
+
+    for year, month, index, title in TURN_OF_YEAR_MONTHS:
+        month_from = dt.date(year, month, 1)
+        month_to = dt.date(year + month // 12, month % 12 + 1, 1) - dt.timedelta(days=1)
+        month_data = [d for d in data if month_from.isoformat() <= d["date"] <= month_to.isoformat()]
+        for options in [(None, None), (True, None), (True, True)]:
+            legacy = legacy_build_tables(copy.deepcopy(month_data), labels, month_from, month_to, *options)
+            current = build_tables(copy.deepcopy(month_data), labels, month_from, month_to, *options)
+            assert legacy == current, f"Results differ for {year}-{month:02d} and decimal_hours, decimal_comma = {options}"
+        assert current[index]["title"] == title, f"{year}-{month:02d}: {current[index]['title']}"
+        print(f"{year}-{month:02d}: identical tables, {title!r}")
+
+    for label, func in [("legacy", legacy_build_tables), ("current", build_tables)]:
+        copies = [copy.deepcopy(data) for _ in range(N_REPEAT)]
+        seconds = timeit.timeit(lambda: func(copies.pop(), labels, from_date, to_date, True, True), number=N_REPEAT) / N_REPEAT
+        print(f"{label:<8} {seconds * 1000:8.1f} ms")
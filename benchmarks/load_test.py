@@ -0,0 +1,135 @@
+"""Latency under mixed import and report traffic against a running timely server.
+
+Seeds the database with one year of synthetic data, then runs concurrent clients:
+most of them read reports and events, a few import and confirm monthly files at the same time.
+Prints p50/p95/p99 latencies per route. Only uses the standard library.
+
+Start the app first (python app/main.py), then run from the project root:
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --duration 20
+"""
+import argparse
+import calendar
+import datetime as dt
+import http.client
+import random
+import statistics
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlparse
+
+YEAR = 2023
+
+
+def ezeit_csv(month:int) -> bytes:
+    lines = ["date;time_worked;day_category;comment"]
+    for d in range(1, calendar.monthrange(YEAR, month)[1] + 1):
+        day = dt.date(YEAR, month, d)
+        if day.weekday() >= 5:
+            lines.append(f"{day:%d.%m.%Y};;frei;")
+        else:
+            lines.append(f"{day:%d.%m.%Y};08:00;07:48;")
+    return "\n".join(lines).encode("utf-8")
+
+
+def outlook_csv(events_per_day:int = 6) -> bytes:
+    categories = ["", "routine", "mrh", "cut", "gemeinkosten"]
+    lines = ["Betreff,Beginnt am,Beginnt um,Endet am,Endet um,Kategorien"]
+    day = dt.date(YEAR, 1, 1)
+    while day.year == YEAR:
+        for i in range(events_per_day if day.weekday() < 5 else 0):
+            d = day.strftime("%d.%m.%Y")
+            lines.append(f"Meeting {i},{d},{8 + i:02d}:00:00,{d},{8 + i:02d}:30:00,{random.choice(categories)}")
+        day += dt.timedelta(days=1)
+    return "\n".join(lines).encode("utf-8")
+
+
+class Client:
+
+    def __init__(self, url:str):
+        parsed = urlparse(url)
+        self.conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=120)
+
+    def request(self, method:str, path:str, body:bytes | None = None, headers:dict | None = None) -> tuple[int, dict, bytes]:
+        self.conn.request(method, path, body=body, headers=headers or dict())
+        response = self.conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+
+    def upload(self, month:int, ezeit:bytes, outlook:bytes) -> str:
+        boundary = uuid.uuid4().hex
+        parts = list()
+        for name, value in [("month", str(month).encode()), ("year", str(YEAR).encode())]:
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode() + value + b"\r\n")
+        for name, content in [("ezeit", ezeit), ("outlook", outlook)]:
+            header = f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}.csv"\r\nContent-Type: text/csv\r\n\r\n'
+            parts.append(header.encode() + content + b"\r\n")
+        parts.append(f"--{boundary}--\r\n".encode())
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        status, headers, _ = self.request("POST", "/api/import_files/parse", b"".join(parts), headers)
+        assert status == 303, status
+        return headers["location"]
+
+
+def import_month(client:Client, month:int, outlook:bytes) -> None:
+    location = client.upload(month, ezeit_csv(month), outlook)
+    cache_id = location.split("/preview/")[1].split("?")[0]
+    last_day = calendar.monthrange(YEAR, month)[1]
+    path = f"/import_files/confirmed?cache_id={cache_id}&min_date={YEAR}-{month:02d}-01&max_date={YEAR}-{month:02d}-{last_day}"
+    status, _, _ = client.request("GET", path)
+    assert status == 200, status
+
+
+def run(url:str, duration:float, readers:int, importers:int) -> None:
+
+    outlook = outlook_csv()
+    seed_client = Client(url)
+    for month in range(1, 13):
+        import_month(seed_client, month, outlook)
+
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def record(route:str, start:float) -> None:
+        with lock:
+            latencies[route].append((time.perf_counter() - start) * 1000)
+
+    def reader() -> None:
+        client = Client(url)
+        while time.perf_counter() < deadline:
+            month = random.randint(1, 12)
+            start = time.perf_counter()
+            client.request("GET", f"/sap/monthly_report?month={month}&year={YEAR}&decimal_hours=true")
+            record("report", start)
+            start = time.perf_counter()
+            client.request("GET", f"/api/events?limit=200&offset={random.randint(0, 1000)}")
+            record("events", start)
+
+    def importer() -> None:
+        client = Client(url)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            import_month(client, random.randint(1, 12), outlook)
+            record("import", start)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=importer) for _ in range(importers)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    print(f"{'route':<8} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, values in sorted(latencies.items()):
+        q = statistics.quantiles(values, n=100)
+        print(f"{route:<8} {len(values):>6} {q[49]:>9.1f} {q[94]:>9.1f} {q[98]:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--readers", type=int, default=32, help="concurrent report and event clients")
+    parser.add_argument("--importers", type=int, default=2, help="concurrent import clients")
+    args = parser.parse_args()
+    random.seed(0)
+    run(args.url, args.duration, args.readers, args.importers)
@@ -0,0 +1,31 @@
+// Loads all rows of an import preview table page by page.
+// The first page is loaded when a table is expanded, further pages by clicking "Load more".
+
+async function appendRows(tbody, url) {
+    const response = await fetch(url);
+    if (!response.ok) {
+        tbody.insertAdjacentHTML('beforeend', `<tr><td>Loading rows failed: ${response.status}</td></tr>`);
+        return;
+    }
+    tbody.insertAdjacentHTML('beforeend', await response.text());
+}
+
+document.querySelectorAll('details.lazy-table').forEach(details => {
+
+    const tbody = details.querySelector('tbody');
+
+    details.addEventListener('toggle', () => {
+        if (details.open && !details.dataset.loaded) {
+            details.dataset.loaded = 'true';
+            appendRows(tbody, details.dataset.rowsUrl);
+        }
+    });
+
+    tbody.addEventListener('click', event => {
+        const button = event.target.closest('tr.load-more button');
+        if (button) {
+            button.closest('tr').remove();
+            appendRows(tbody, button.dataset.rowsUrl);
+        }
+    });
+});
@@ -0,0 +1,18 @@
+// Loads the week tables of a month of the SAP report when it is expanded for the first time.
+
+document.querySelectorAll('details.lazy-weeks').forEach(details => {
+
+    const container = details.querySelector('div');
+
+    details.addEventListener('toggle', async () => {
+        if (details.open && !details.dataset.loaded) {
+            details.dataset.loaded = 'true';
+            const response = await fetch(details.dataset.weeksUrl);
+            if (!response.ok) {
+                container.textContent = `Loading weeks failed: ${response.status}`;
+                return;
+            }
+            container.innerHTML = await response.text();
+        }
+    });
+});
@@ -1,15 +1,22 @@
 import sys
-import uvicorn
+import time
+import argparse
+import asyncio
+import multiprocessing
 
 if sys.platform == "win32":
     # see https://pyinstaller.org/en/stable/common-issues-and-pitfalls.html#windows
     import ctypes
     ctypes.windll.kernel32.SetDllDirectoryW(None)
 
-from app.main import app
 
 def serve():
     """Serve the web application."""
+
+    # imported here, so that parser worker processes do not import the app on their startup
+    import uvicorn
+    from app.main import app
+
     uvicorn.run(
             app,
             host="0.0.0.0",
@@ -17,5 +24,38 @@ def serve():
             reload=False
         )
 
+
+def profile_startup():
+    """Imports and starts the app without serving it, then prints the time spent per import and startup step."""
+
+    from app import startup_profile
+    startup_profile.profile_imports()
+
+    start = time.perf_counter()
+    with startup_profile.step("import app"):
+        from app.main import app
+
+    async def startup_and_shutdown():
+        async with app.router.lifespan_context(app):
+            pass
+    asyncio.run(startup_and_shutdown())
+
+    print()
+    print(startup_profile.report())
+    print(f"\nStartup took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
 if __name__ == "__main__":
-    serve()
\ No newline at end of file
+    # required for process pools in frozen applications, see
+    # https://pyinstaller.org/en/stable/common-issues-and-pitfalls.html#multi-processing
+    multiprocessing.freeze_support()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile-startup", action="store_true",
+        help="report import and startup time per module instead of serving the app")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        profile_startup()
+    else:
+        serve()
@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+
+import pytest
+
+from app.config import CONFIG_PATH, ConfigService
+
+
+@pytest.fixture
+def service(tmp_path):
+    """A configuration service reading a copy of the app's configuration file"""
+    config_path = tmp_path / "config.json"
+    config_path.write_text(CONFIG_PATH.read_text())
+    return ConfigService(config_path)
+
+
+def change_labels(service:ConfigService) -> None:
+    config = json.loads(service.config_path.read_text())
+    for cost_unit in config["cost_units"].values():
+        cost_unit["label"] += " (changed)"
+    service.config_path.write_text(json.dumps(config))
+    stat = service.config_path.stat()
+    os.utime(service.config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000)) # in case the size matches
+
+
+def test_reload_waits_for_pinned_snapshot(service):
+    rebuilt = threading.Event()
+    service.subscribe(lambda old, new: rebuilt.set(), before_swap=True)
+    change_labels(service)
+
+    with service.pinned() as config:
+        reload = threading.Thread(target=service.reload)
+        reload.start()
+        reload.join(timeout=0.2)
+
+        # neither rebuilt nor swapped while the snapshot is pinned
+        assert reload.is_alive()
+        assert not rebuilt.is_set()
+        assert service.current is config
+
+    reload.join(timeout=5)
+    assert rebuilt.is_set()
+    assert service.current is not config
+
+
+def test_waiting_reload_holds_off_new_pins(service):
+    change_labels(service)
+    pinned = list()
+
+    with service.pinned() as first:
+        reload = threading.Thread(target=service.reload)
+        reload.start()
+        reload.join(timeout=0.2)
+
+        def pin():
+            with service.pinned() as config:
+                pinned.append(config)
+
+        later = threading.Thread(target=pin)
+        later.start()
+        later.join(timeout=0.2)
+        assert later.is_alive() # queued behind the reload instead of starving it
+
+    reload.join(timeout=5)
+    later.join(timeout=5)
+    assert pinned == [service.current]
+    assert pinned[0] is not first
@@ -0,0 +1,60 @@
+from datetime import date, datetime
+from uuid import uuid4
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.database.sqlite_operations as sql_ops
+import app.database.db as db
+import app.routers.agg_time_by_cost_unit as agg
+from app.config import current_config
+from app.models import Event
+
+MARCH = {"from_date": "2024-03-01", "to_date": "2024-03-31"}
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    """Client of the aggregation api on a fresh database file"""
+
+    sql_ops.close_connections()
+    monkeypatch.setattr(sql_ops, "DATABASE", tmp_path / "test.db")
+    monkeypatch.setattr(sql_ops, "_staging_schema_sql", "")
+    db.initiate_db()
+    db.sync_cost_units(current_config().config.cost_units)
+    agg.AGG_CACHE.invalidate()
+    agg.AMBIGUITY_CACHE.invalidate()
+
+    app = FastAPI()
+    app.include_router(agg.router)
+    yield TestClient(app)
+    sql_ops.close_connections()
+
+
+def import_event(day:date, categories:str) -> None:
+    event = Event(start=f"{day}T09:00:00", end=f"{day}T10:00:00", categories=categories, source="outlook",
+        additional_metadata=None)
+    cache_id = uuid4()
+    db.cache_data(Event, [event], cache_id, datetime.now())
+    db.store_data(Event, cache_id, day, day)
+
+
+def test_unchanged_aggregation_is_not_modified(client):
+    response = client.get("/api/agg_time_by_cost_unit", params=MARCH)
+    assert response.status_code == 200
+
+    etag = response.headers["etag"]
+    response = client.get("/api/agg_time_by_cost_unit", params=MARCH, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_ambigous_mapping_outside_of_range_is_not_hidden_by_etag(client):
+    response = client.get("/api/agg_time_by_cost_unit", params=MARCH)
+    assert response.status_code == 200
+
+    # mapped to two cost units, fails the aggregation of any date range
+    import_event(date(2024, 1, 15), '["mrh", "cut"]')
+    response = client.get("/api/agg_time_by_cost_unit", params=MARCH, headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 500
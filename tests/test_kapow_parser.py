@@ -0,0 +1,24 @@
+import io
+from datetime import date
+
+import pytest
+
+from app.parsers.kapow_parser import parse_kapow_sessions
+
+
+def kapow_file(*session_dates:str) -> io.BytesIO:
+    sessions = "".join(f'<session date="{d}" start="09:00:00" stop="10:00:00" billed="0" note=""/>' for d in session_dates)
+    return io.BytesIO(f'<kapow><project name="mrh">{sessions}</project></kapow>'.encode("utf-8"))
+
+
+def test_sessions_are_filtered_by_date():
+    file = kapow_file("2024-02-29", "2024-03-01", "2024-03-31", "2024-04-01")
+    events = parse_kapow_sessions(file, date(2024, 3, 1), date(2024, 3, 31))
+    assert [e.start.date() for e in events] == [date(2024, 3, 1), date(2024, 3, 31)]
+
+
+@pytest.mark.parametrize("session_date", ["2024-3-01", "01.03.2024", "2024-03-01T09:00", ""])
+def test_malformed_date_outside_of_range_is_raised(session_date):
+    file = kapow_file("2024-03-01", session_date)
+    with pytest.raises(ValueError):
+        parse_kapow_sessions(file, date(2024, 3, 1), date(2024, 3, 31))
@@ -0,0 +1,114 @@
+import pytest
+
+import app.database.sqlite_operations as sql_ops
+import app.database.db as db
+from app.models import EZeitDay, Event
+from app.database.pydantic_to_sqlite import table_columns, models_to_rows
+
+
+@pytest.fixture
+def temp_db(monkeypatch, tmp_path):
+    """Points the connection pool to a fresh database file"""
+
+    sql_ops.close_connections()
+    monkeypatch.setattr(sql_ops, "DATABASE", tmp_path / "test.db")
+    monkeypatch.setattr(sql_ops, "_staging_schema_sql", "")
+    yield
+    sql_ops.close_connections()
+
+
+def generated_columns(table_name:str) -> dict[str, int]:
+    """Names of generated columns and their hidden flag, 2 for virtual and 3 for stored columns"""
+    return {r[1]: r[6] for r in sql_ops.fetch_all(f"PRAGMA table_xinfo({table_name});") if r[6] in (2, 3)}
+
+
+def declared_indexes(table_name:str) -> list[str]:
+    """Names of the indexes on given table, except those sqlite creates for primary keys"""
+    return [r[1] for r in sql_ops.fetch_all(f"PRAGMA index_list({table_name});") if r[3] == "c"]
+
+
+@pytest.mark.parametrize("model", db.CORE_DATA_MODELS, ids=lambda m: m.__name__)
+def test_tables_get_declared_indexes_and_generated_columns(temp_db, model):
+    db.initiate_db()
+
+    assert generated_columns(model.table_name) == {c.name: 3 for c in model.generated_columns}
+    assert len(declared_indexes(model.table_name)) == len(model.indexes)
+
+
+def test_initiate_db_migrates_existing_tables(temp_db):
+
+    # events table as created before generated columns were declared
+    sql_ops.execute("""CREATE TABLE events (id TEXT NOT NULL PRIMARY KEY, start TEXT NOT NULL, end TEXT NOT NULL,
+        categories TEXT NOT NULL, source TEXT NOT NULL, additional_metadata TEXT);""")
+    sql_ops.execute("""INSERT INTO events VALUES ('a', '2024-03-01T23:30:00', '2024-03-02T00:30:00', '[]', 'kapow', NULL);""")
+
+    db.initiate_db()
+    db.initiate_db() # safe to run again
+
+    # stored columns can not be added to existing tables, virtual ones are indexed just the same
+    assert generated_columns(Event.table_name) == {"start_date": 2}
+    assert len(declared_indexes(Event.table_name)) == len(Event.indexes)
+    assert sql_ops.fetch_all("SELECT start_date FROM events;") == [("2024-03-01",)]
+
+
+def test_initiate_db_drops_superseded_indexes(temp_db):
+    db.initiate_db()
+    sql_ops.execute("CREATE INDEX idx_ezeit_days_date ON ezeit_days (date);")
+    sql_ops.execute("CREATE INDEX idx_events_source_start ON events (source, start);")
+
+    db.initiate_db()
+
+    for model in [EZeitDay, Event]:
+        assert len(declared_indexes(model.table_name)) == len(model.indexes)
+
+
+def test_date_range_filter_uses_index(temp_db):
+    db.initiate_db()
+
+    plan = sql_ops.fetch_all("EXPLAIN QUERY PLAN SELECT id FROM events WHERE start_date BETWEEN '2024-01-01' AND '2024-01-31';")
+    assert "USING INDEX" in plan[0][3] or "USING COVERING INDEX" in plan[0][3]
+
+
+@pytest.mark.parametrize("model", db.CORE_DATA_MODELS + db.CORE_DATA_CACHES, ids=lambda m: m.__name__)
+def test_table_columns_match_created_table(temp_db, model):
+    db.initiate_db()
+    schema, _, table = model.table_name.rpartition(".")
+    schema = f"{schema}." if schema else ""
+
+    # staging tables are only visible to the writer connection, hidden > 0 marks generated columns
+    rows = sql_ops.fetch_all_as_dicts_staged(f"PRAGMA {schema}table_xinfo({table});")
+    columns = tuple(r["name"] for r in rows if r["hidden"] == 0)
+
+    assert columns == table_columns(model)
+
+
+@pytest.mark.parametrize("additional_metadata", [None, '{"subject": "Weekly", "attendees": 3}'])
+def test_event_round_trip(temp_db, additional_metadata):
+    db.initiate_db()
+    event = Event(
+        start="2024-03-01T09:00:00", end="2024-03-01T10:30:00",
+        categories='["mrh", "overhead"]', source="outlook",
+        additional_metadata=additional_metadata
+    )
+    columns = table_columns(Event)
+
+    rows = models_to_rows([event], columns)
+    sql_ops.insert_many(Event.table_name, rows, list(columns))
+
+    record = sql_ops.fetch_all_as_dicts(f"SELECT * FROM {Event.table_name};", {})[0]
+    assert record["start_date"] == "2024-03-01"
+    if additional_metadata is None:
+        assert record["additional_metadata"] is None # NULL, not the json string "null"
+    assert Event.model_validate({c: record[c] for c in columns}) == event
+
+
+def test_legacy_cache_tables_move_to_staging(temp_db):
+
+    # cache table as created before the staging store existed
+    sql_ops.execute("CREATE TABLE events_cache (id TEXT NOT NULL PRIMARY KEY, cache_id TEXT NOT NULL);")
+
+    db.initiate_db()
+
+    assert sql_ops.fetch_all("SELECT name FROM main.sqlite_master WHERE name LIKE '%_cache';") == []
+    staged = sql_ops.fetch_all_staged("SELECT name FROM staging.sqlite_master WHERE type = 'table';")
+    assert sorted(r[0] for r in staged) == ["events_cache", "ezeit_days_cache"]
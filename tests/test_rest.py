@@ -0,0 +1,67 @@
+import asyncio
+import sqlite3
+
+import pytest
+from fastapi import HTTPException
+
+import app.routers.rest as rest
+
+
+@pytest.fixture
+def events_db(monkeypatch):
+    """A large events table in memory, queried by the rest router instead of the app database.
+    Every query is recorded."""
+
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE events (id TEXT, source TEXT, date TEXT);")
+    conn.executemany("INSERT INTO events VALUES (?, ?, ?);", [
+        (f"id-{i}", "kapow" if i % 10 == 0 else "outlook", f"{2020 + i // 20000}-01-01") for i in range(100000)
+    ])
+    queries = list()
+
+    async def fetch_all_as_dicts(sql:str, params:dict) -> list[dict]:
+        queries.append(sql)
+        return [dict(row) for row in conn.execute(sql, params)]
+
+    monkeypatch.setattr(rest.adb, "fetch_all_as_dicts", fetch_all_as_dicts)
+    yield queries
+    conn.close()
+
+
+@pytest.mark.parametrize("conditions, params", [
+    ([], {}),
+    (["source = :source"], {"source": "kapow"}),
+    (["date >= :from_date", "date <= :to_date"], {"from_date": "2022-01-01", "to_date": "2022-01-01"}),
+])
+def test_sample_fills_limit_without_sorting(events_db, conditions, params):
+    for _ in range(20):
+        events_db.clear()
+        data = asyncio.run(rest._get_sample("events", "*", conditions, {**params, "limit": 50}, 50))
+
+        assert len(data) == 50
+        assert len(set(row["id"] for row in data)) == 50
+        assert len(events_db) == 1 # no fallback to ORDER BY RANDOM()
+        if "source" in params:
+            assert all(row["source"] == "kapow" for row in data)
+        if "from_date" in params:
+            assert all(row["date"] == "2022-01-01" for row in data)
+
+
+def test_sample_falls_back_to_sorting_when_matches_are_few(events_db):
+    data = asyncio.run(rest._get_sample("events", "*", ["id = :id"], {"id": "id-7", "limit": 10}, 10))
+    assert [row["id"] for row in data] == ["id-7"]
+    assert len(events_db) == 2
+
+
+def test_cursor_round_trip():
+    cursor = rest._encode_cursor("2025-06-02T08:00:00", "abc")
+    assert rest._decode_cursor(cursor) == ("2025-06-02T08:00:00", "abc")
+
+
+@pytest.mark.parametrize("cursor", ["NQ==", "not base64!", "WyJhIl0=", "WyJhIiwgMV0=", "ImFiIg=="])
+def test_invalid_cursor(cursor):
+    # decoded: 5, invalid, ["a"], ["a", 1], "ab"
+    with pytest.raises(HTTPException) as exc:
+        rest._decode_cursor(cursor)
+    assert exc.value.status_code == 422
@@ -0,0 +1,12 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+
+
+def test_parsers_are_not_imported_on_startup():
+    # a fresh interpreter, as the tests themselves import the parsers
+    code = "import sys, app.main; print([m for m in sys.modules if m.startswith(('app.parsers', 'lxml'))])"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"